@@ -0,0 +1,311 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from posts.models import Comment, Follow, Group, Post
+from posts.stats import recount_user_stats
+
+User = get_user_model()
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def media_url(name):
+    return default_storage.url(name) if name else None
+
+
+class Resource:
+    """Модель в API: поля ответа, раскрываемые ссылки и фильтры.
+
+    fields сопоставляет имя поля в ответе с именем для values(),
+    expand — поле-ссылку с ресурсом, которым её можно заменить.
+    Строки читаются через values(), без создания экземпляров моделей.
+    """
+    model = None
+    fields = {}
+    expand = {}
+    filters = {}
+    converters = {}
+    # Поле сортировки по убыванию; вместе с id образует курсор
+    order_field = None
+    # Параметры пакетного запроса и поля, по которым ищутся объекты
+    batch_keys = {'ids': 'pk'}
+
+    def queryset(self):
+        return self.model.objects.all()
+
+    def parse_fields(self, value):
+        if not value:
+            return list(self.fields)
+        names = [name for name in value.split(',') if name]
+        unknown = set(names) - set(self.fields)
+        if unknown:
+            raise ApiError(400, f'Неизвестные поля: {", ".join(unknown)}')
+        return names
+
+    def parse_expand(self, value):
+        names = [name for name in (value or '').split(',') if name]
+        unknown = set(names) - set(self.expand)
+        if unknown:
+            raise ApiError(
+                400, f'Нельзя раскрыть: {", ".join(unknown)}'
+            )
+        return names
+
+    def parse_filter(self, lookup, value):
+        """Приводит значение фильтра к типу поля, на которое он ссылается."""
+        model = self.model
+        for part in lookup.split('__'):
+            field = model._meta.get_field(part)
+            model = field.related_model
+        return field.to_python(value)
+
+    def filter(self, queryset, params):
+        for name, lookup in self.filters.items():
+            if name not in params:
+                continue
+            try:
+                value = self.parse_filter(lookup, params[name])
+            except ValidationError:
+                raise ApiError(400, f'Неверное значение фильтра {name}')
+            queryset = queryset.filter(**{lookup: value})
+        return queryset
+
+    def parse_batch(self, params):
+        """Возвращает поле поиска и список ключей в порядке запроса."""
+        given = [name for name in self.batch_keys if params.get(name)]
+        if len(given) != 1:
+            raise ApiError(
+                400, f'Нужен один из параметров: {", ".join(self.batch_keys)}'
+            )
+        name = given[0]
+        keys = list(dict.fromkeys(
+            key for key in params[name].split(',') if key
+        ))
+        if len(keys) > settings.API_BATCH_LIMIT:
+            raise ApiError(
+                400, f'Не больше {settings.API_BATCH_LIMIT} ключей за раз'
+            )
+        lookup = self.batch_keys[name]
+        if lookup == 'pk':
+            try:
+                keys = [int(key) for key in keys]
+            except ValueError:
+                raise ApiError(400, f'{name} должны быть числами')
+        return lookup, keys
+
+    def ordering(self):
+        if self.order_field is None:
+            return ['-pk']
+        return [f'-{self.order_field}', '-pk']
+
+    def encode_cursor(self, row):
+        key = [row['pk']]
+        if self.order_field is not None:
+            key.insert(0, row[self.order_field].isoformat())
+        value = json.dumps(key)
+        return base64.urlsafe_b64encode(value.encode()).decode()
+
+    def after_cursor(self, queryset, token):
+        try:
+            key = json.loads(base64.urlsafe_b64decode(token.encode()))
+            pk = int(key[-1])
+            value = parse_datetime(key[0]) if self.order_field else None
+        except (binascii.Error, UnicodeError, ValueError, TypeError,
+                IndexError):
+            raise ApiError(400, 'Испорченный курсор')
+        if self.order_field is None:
+            return queryset.filter(pk__lt=pk)
+        if value is None:
+            raise ApiError(400, 'Испорченный курсор')
+        return queryset.filter(
+            Q(**{f'{self.order_field}__lt': value})
+            | Q(**{self.order_field: value, 'pk__lt': pk})
+        )
+
+    def rows(self, queryset, names, extra=()):
+        lookups = {self.fields[name] for name in names} | {'pk', *extra}
+        if self.order_field is not None:
+            lookups.add(self.order_field)
+        return queryset.order_by(*self.ordering()).values(*lookups)
+
+    def render(self, row, names):
+        item = {}
+        for name in names:
+            value = row[self.fields[name]]
+            convert = self.converters.get(name)
+            item[name] = convert(value) if convert else value
+        return item
+
+    def annotate(self, request, rows, items):
+        """Дополняет готовые объекты страницы; по умолчанию ничего."""
+
+    def in_bulk(self, pks):
+        """Объекты по id одним запросом, с полями по умолчанию."""
+        names = list(self.fields)
+        return {
+            row['pk']: self.render(row, names)
+            for row in self.rows(self.queryset().filter(pk__in=pks), names)
+        }
+
+
+class UserResource(Resource):
+    model = User
+    fields = {
+        'id': 'pk',
+        'username': 'username',
+        'first_name': 'first_name',
+        'last_name': 'last_name',
+    }
+
+
+class ProfileResource(UserResource):
+    """Пользователь со счётчиками профиля и подпиской зрителя на него."""
+    fields = {
+        **UserResource.fields,
+        'followers': 'stats__followers',
+        'following': 'stats__following',
+        'posts': 'stats__posts',
+    }
+    batch_keys = {'ids': 'pk', 'usernames': 'username'}
+    stats_fields = ('followers', 'following', 'posts')
+
+    def fill_stats(self, rows, items):
+        missing = [
+            row['pk'] for row, item in zip(rows, items)
+            if any(item.get(name, 0) is None for name in self.stats_fields)
+        ]
+        if not missing:
+            return
+        # Строки счётчиков создаются лениво: досчитываем все разом
+        stats = {
+            item.user_id: item
+            for item in recount_user_stats(
+                User.objects.filter(pk__in=missing), replace=False
+            )
+        }
+        for row, item in zip(rows, items):
+            for name in self.stats_fields:
+                if item.get(name, 0) is None:
+                    item[name] = getattr(stats[row['pk']], name)
+
+    def annotate(self, request, rows, items):
+        self.fill_stats(rows, items)
+        followed = set()
+        if request.user.is_authenticated:
+            followed = set(Follow.objects.filter(
+                user=request.user,
+                author_id__in=[row['pk'] for row in rows]
+            ).values_list('author_id', flat=True))
+        for row, item in zip(rows, items):
+            item['is_following'] = row['pk'] in followed
+
+
+class GroupResource(Resource):
+    model = Group
+    fields = {
+        'id': 'pk',
+        'title': 'title',
+        'slug': 'slug',
+        'description': 'description',
+    }
+
+
+class PostResource(Resource):
+    model = Post
+    fields = {
+        'id': 'pk',
+        'text': 'text',
+        'pub_date': 'pub_date',
+        'author': 'author_id',
+        'group': 'group_id',
+        'image': 'image',
+    }
+    expand = {'author': 'users', 'group': 'groups'}
+    filters = {'author': 'author__username', 'group': 'group__slug'}
+    converters = {'image': media_url}
+    order_field = 'pub_date'
+
+    def rows(self, queryset, names, extra=()):
+        if 'image' in names:
+            extra = [*extra, 'image_ready']
+        return super().rows(queryset, names, extra)
+
+    def render(self, row, names):
+        item = super().render(row, names)
+        # Картинку отдаём, только когда её обработка закончена
+        if 'image' in item and not row['image_ready']:
+            item['image'] = None
+        return item
+
+
+class CommentResource(Resource):
+    model = Comment
+    fields = {
+        'id': 'pk',
+        'post': 'post_id',
+        'author': 'author_id',
+        'text': 'text',
+        'created': 'created',
+    }
+    expand = {'author': 'users', 'post': 'posts'}
+    filters = {'post': 'post_id', 'author': 'author__username'}
+    order_field = 'created'
+
+
+class FollowResource(Resource):
+    model = Follow
+    fields = {'id': 'pk', 'user': 'user_id', 'author': 'author_id'}
+    expand = {'user': 'users', 'author': 'users'}
+    filters = {'user': 'user__username', 'author': 'author__username'}
+
+
+RESOURCES = {
+    'users': UserResource(),
+    'profiles': ProfileResource(),
+    'groups': GroupResource(),
+    'posts': PostResource(),
+    'comments': CommentResource(),
+    'follows': FollowResource(),
+}
+
+
+def get_resource(name):
+    resource = RESOURCES.get(name)
+    if resource is None:
+        raise ApiError(404, f'Нет ресурса {name}')
+    return resource
+
+
+def expand_items(resource, items, names):
+    """Заменяет id в ссылках объектами: один запрос на целевой ресурс.
+
+    Ссылки на один ресурс (например, user и author у подписки)
+    собираются вместе, так что число запросов не зависит от размера
+    страницы.
+    """
+    targets = {}
+    for name in names:
+        targets.setdefault(resource.expand[name], []).append(name)
+    for target, fields in targets.items():
+        pks = {
+            item[field] for item in items for field in fields
+            if item[field] is not None
+        }
+        objects = get_resource(target).in_bulk(pks) if pks else {}
+        for item in items:
+            for field in fields:
+                if item[field] is not None:
+                    item[field] = objects.get(item[field])
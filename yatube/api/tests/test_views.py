@@ -0,0 +1,192 @@
+from http import HTTPStatus
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.testing import QueryBudgetMixin
+from posts.models import Comment, Follow, Group, Post, UserStats
+from posts.stats import get_user_stats
+
+User = get_user_model()
+
+
+class ApiTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(
+            username='writer', first_name='Лев'
+        )
+        cls.group = Group.objects.create(
+            title='Классики', slug='classics', description='Текст'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.posts = [
+            Post.objects.create(
+                text=f'Запись {number}', author=cls.author, group=cls.group
+            )
+            for number in range(25)
+        ]
+        Post.objects.create(text='Без группы', author=cls.reader)
+        Comment.objects.create(
+            post=cls.posts[0], author=cls.reader, text='Отлично'
+        )
+
+    def get(self, resource, pk=None, **params):
+        if pk is None:
+            url = reverse('api:list', args=[resource])
+        else:
+            url = reverse('api:detail', args=[resource, pk])
+        return self.client.get(url, params)
+
+    def test_cursor_pagination_walks_all_posts(self):
+        seen = []
+        response = self.get('posts', limit=10)
+        while True:
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            data = response.json()
+            seen += [item['id'] for item in data['results']]
+            if data['next'] is None:
+                break
+            response = self.client.get(data['next'])
+        expected = list(Post.objects.order_by(
+            '-pub_date', '-pk'
+        ).values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_fields_limit_the_response(self):
+        data = self.get('posts', fields='id,text').json()
+        self.assertEqual(set(data['results'][0]), {'id', 'text'})
+
+    def test_expand_is_batched(self):
+        response = self.get('posts', limit=26, expand='author,group')
+        self.assertWithinQueryBudget(response)
+        items = response.json()['results']
+        self.assertEqual(len(items), 26)
+        self.assertEqual(items[1]['author']['first_name'], 'Лев')
+        self.assertEqual(items[1]['group']['slug'], 'classics')
+        self.assertIsNone(items[0]['group'])
+
+    def test_follow_links_share_one_query(self):
+        response = self.get('follows', expand='user,author')
+        self.assertWithinQueryBudget(response)
+        self.assertEqual(response.json()['results'][0]['author']['username'],
+                         'writer')
+
+    def test_filters(self):
+        urls = {
+            ('posts', 'group', 'classics'): 20,
+            ('posts', 'author', 'reader'): 1,
+            ('comments', 'post', self.posts[0].pk): 1,
+            ('follows', 'user', 'writer'): 0,
+        }
+        for (resource, name, value), count in urls.items():
+            with self.subTest(resource=resource, name=name):
+                data = self.get(resource, **{name: value}).json()
+                self.assertEqual(len(data['results']), count)
+
+    def test_detail(self):
+        post = self.posts[0]
+        response = self.get('posts', post.pk, expand='author')
+        self.assertWithinQueryBudget(response)
+        self.assertEqual(response.json()['text'], post.text)
+        self.assertEqual(response.json()['author']['username'], 'writer')
+
+    def test_errors_are_json(self):
+        requests = {
+            self.get('posts', fields='password'): HTTPStatus.BAD_REQUEST,
+            self.get('posts', expand='text'): HTTPStatus.BAD_REQUEST,
+            self.get('posts', cursor='broken'): HTTPStatus.BAD_REQUEST,
+            self.get('posts', limit='many'): HTTPStatus.BAD_REQUEST,
+            self.get('comments', post='abc'): HTTPStatus.BAD_REQUEST,
+            self.get('comments', post=''): HTTPStatus.BAD_REQUEST,
+            self.get('secrets'): HTTPStatus.NOT_FOUND,
+            self.get('posts', 0): HTTPStatus.NOT_FOUND,
+        }
+        for response, status in requests.items():
+            with self.subTest(status=status):
+                self.assertEqual(response.status_code, status)
+                self.assertIn('error', response.json())
+
+    def test_api_is_read_only(self):
+        response = self.client.post(reverse('api:list', args=['posts']))
+        self.assertEqual(
+            response.status_code, HTTPStatus.METHOD_NOT_ALLOWED
+        )
+
+
+class BatchTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [
+            User.objects.create_user(username=f'writer{number}')
+            for number in range(5)
+        ]
+        Follow.objects.create(user=cls.reader, author=cls.authors[1])
+        cls.posts = [
+            Post.objects.create(text=f'Запись {author}', author=author)
+            for author in cls.authors
+        ]
+
+    def batch(self, resource, **params):
+        return self.client.get(reverse('api:batch', args=[resource]), params)
+
+    def test_posts_keep_request_order(self):
+        ids = [self.posts[3].pk, 0, self.posts[1].pk, self.posts[3].pk]
+        response = self.batch(
+            'posts', ids=','.join(map(str, ids)), expand='author'
+        )
+        self.assertWithinQueryBudget(response)
+        data = response.json()
+        self.assertEqual(
+            [item['id'] for item in data['results']],
+            [self.posts[3].pk, self.posts[1].pk]
+        )
+        self.assertEqual(data['results'][1]['author']['username'], 'writer1')
+        self.assertEqual(data['missing'], [0])
+
+    def test_profiles_by_username(self):
+        self.client.force_login(self.reader)
+        for user in self.authors[:3]:
+            get_user_stats(user.pk)
+        response = self.batch(
+            'profiles', usernames='writer0,writer1,writer2,nobody'
+        )
+        self.assertWithinQueryBudget(response)
+        data = response.json()
+        self.assertEqual(
+            [item['is_following'] for item in data['results']],
+            [False, True, False]
+        )
+        self.assertEqual(data['results'][1]['followers'], 1)
+        self.assertEqual(data['missing'], ['nobody'])
+
+    def test_missing_stats_are_counted(self):
+        UserStats.objects.all().delete()
+        response = self.batch('profiles', usernames='writer1,reader')
+        # Ленивый пересчёт тоже укладывается в бюджет пакетного запроса
+        self.assertWithinQueryBudget(response)
+        data = response.json()
+        self.assertEqual(
+            [(item['followers'], item['following'], item['posts'])
+             for item in data['results']],
+            [(1, 0, 1), (0, 1, 0)]
+        )
+
+    @override_settings(API_BATCH_LIMIT=2)
+    def test_bad_batches(self):
+        requests = [
+            self.batch('posts'),
+            self.batch('posts', ids='1,x'),
+            self.batch('posts', ids='1,2,3'),
+            self.batch('posts', usernames='writer1'),
+        ]
+        for response in requests:
+            with self.subTest(url=response.request['QUERY_STRING']):
+                self.assertEqual(
+                    response.status_code, HTTPStatus.BAD_REQUEST
+                )
@@ -0,0 +1,11 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    path('<str:resource>/', views.resource_list, name='list'),
+    path('<str:resource>/batch/', views.resource_batch, name='batch'),
+    path('<str:resource>/<int:pk>/', views.resource_detail, name='detail'),
+]
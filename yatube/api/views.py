@@ -0,0 +1,108 @@
+from functools import wraps
+
+from django.http import JsonResponse
+from django.views.decorators.http import require_safe
+
+from yatube.settings import API_MAX_PAGE_SIZE, API_PAGE_SIZE
+
+from .resources import ApiError, expand_items, get_resource
+
+
+def api_view(view):
+    """Только чтение; ошибки запроса отдаются в JSON, а не страницей."""
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as error:
+            return JsonResponse(
+                {'error': error.message}, status=error.status
+            )
+    return wrapper
+
+
+def parse_limit(value):
+    if value is None:
+        return API_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ApiError(400, 'limit должен быть числом')
+    if limit < 1:
+        raise ApiError(400, 'limit должен быть больше нуля')
+    return min(limit, API_MAX_PAGE_SIZE)
+
+
+def parse_query(resource, params):
+    expand = resource.parse_expand(params.get('expand'))
+    names = resource.parse_fields(params.get('fields'))
+    # Раскрываемое поле попадает в ответ, даже если его не перечислили
+    names += [name for name in expand if name not in names]
+    return names, expand
+
+
+def render_items(request, resource, rows, names, expand):
+    items = [resource.render(row, names) for row in rows]
+    expand_items(resource, items, expand)
+    resource.annotate(request, rows, items)
+    return items
+
+
+def next_url(request, cursor):
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+
+@api_view
+def resource_list(request, resource):
+    resource = get_resource(resource)
+    names, expand = parse_query(resource, request.GET)
+    limit = parse_limit(request.GET.get('limit'))
+    queryset = resource.filter(resource.queryset(), request.GET)
+    cursor = request.GET.get('cursor')
+    if cursor:
+        queryset = resource.after_cursor(queryset, cursor)
+    # Лишняя строка показывает, есть ли следующая страница, без COUNT(*)
+    rows = list(resource.rows(queryset, names)[:limit + 1])
+    next_page = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_page = next_url(request, resource.encode_cursor(rows[-1]))
+    return JsonResponse({
+        'results': render_items(request, resource, rows, names, expand),
+        'next': next_page,
+    })
+
+
+@api_view
+def resource_detail(request, resource, pk):
+    resource = get_resource(resource)
+    names, expand = parse_query(resource, request.GET)
+    rows = list(resource.rows(resource.queryset().filter(pk=pk), names))
+    if not rows:
+        raise ApiError(404, 'Объект не найден')
+    items = render_items(request, resource, rows, names, expand)
+    return JsonResponse(items[0])
+
+
+@api_view
+def resource_batch(request, resource):
+    """Много объектов по id (или именам) за фиксированное число запросов.
+
+    Ответ идёт в порядке запроса; ненайденные ключи — в missing.
+    """
+    resource = get_resource(resource)
+    names, expand = parse_query(resource, request.GET)
+    lookup, keys = resource.parse_batch(request.GET)
+    queryset = resource.queryset().filter(**{f'{lookup}__in': keys})
+    found = {
+        row[lookup]: row
+        for row in resource.rows(queryset, names, extra=[lookup])
+    }
+    rows = [found[key] for key in keys if key in found]
+    return JsonResponse({
+        'results': render_items(request, resource, rows, names, expand),
+        'missing': [key for key in keys if key not in found],
+    })
@@ -0,0 +1,96 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .metrics import add_to_metric
+
+# Верхние границы корзин гистограммы задержек, мс; последняя — без границы
+LATENCY_BUCKETS = (1, 5, 25, 100, 500)
+BUCKET_NAMES = tuple(f'le{bound}' for bound in LATENCY_BUCKETS) + ('inf',)
+QUERY_KINDS = ('read', 'write')
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Настраивает каждое новое соединение с SQLite из SQLITE_PRAGMAS.
+
+    WAL пускает читателей параллельно с записью; остальные параметры
+    живут только в соединении, поэтому задаются при каждом подключении.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def bucket_name(milliseconds):
+    for bound, name in zip(LATENCY_BUCKETS, BUCKET_NAMES):
+        if milliseconds <= bound:
+            return name
+    return BUCKET_NAMES[-1]
+
+
+def latency_key(kind, name):
+    return f'db_latency:{kind}:{name}'
+
+
+def metric_keys():
+    names = ('count', 'total_us') + BUCKET_NAMES
+    return [latency_key(kind, name) for kind in QUERY_KINDS for name in names]
+
+
+def record_latency(profile):
+    """Добавляет задержки запросов в общую для воркеров гистограмму."""
+    if not settings.DB_METRICS:
+        return
+    for kind, timings in profile.timings.items():
+        if not timings:
+            continue
+        deltas = {'count': len(timings)}
+        deltas['total_us'] = int(sum(timings) * 1_000_000)
+        for elapsed in timings:
+            name = bucket_name(elapsed * 1000)
+            deltas[name] = deltas.get(name, 0) + 1
+        for name, delta in deltas.items():
+            add_to_metric(latency_key(kind, name), delta)
+
+
+def get_latency_metrics():
+    """{вид: {'count', 'avg_ms', 'buckets': {корзина: число}}}."""
+    found = cache.get_many(metric_keys())
+    metrics = {}
+    for kind in QUERY_KINDS:
+        count = found.get(latency_key(kind, 'count'), 0)
+        total = found.get(latency_key(kind, 'total_us'), 0)
+        metrics[kind] = {
+            'count': count,
+            'avg_ms': total / count / 1000 if count else 0,
+            'buckets': {
+                name: found.get(latency_key(kind, name), 0)
+                for name in BUCKET_NAMES
+            },
+        }
+    return metrics
+
+
+def reset_latency_metrics():
+    cache.delete_many(metric_keys())
+
+
+def copy_database(source, target):
+    """Копирует файл SQLite в реплику через backup API.
+
+    Копия согласованная, даже если в основную базу в это время пишут;
+    читатели реплики видят либо старый, либо новый снимок.
+    """
+    source = sqlite3.connect(source)
+    target = sqlite3.connect(target)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
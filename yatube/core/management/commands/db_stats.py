@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from core.database import get_latency_metrics, reset_latency_metrics
+
+
+class Command(BaseCommand):
+    help = 'Показывает задержки чтения и записи в базу по всем воркерам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Обнулить метрики после вывода'
+        )
+
+    def handle(self, *args, **options):
+        for kind, metrics in get_latency_metrics().items():
+            buckets = ', '.join(
+                f'{name}: {count}'
+                for name, count in metrics['buckets'].items()
+            )
+            self.stdout.write(
+                f'{kind}: запросов {metrics["count"]}, '
+                f'в среднем {metrics["avg_ms"]:.2f} мс ({buckets})'
+            )
+        if options['reset']:
+            reset_latency_metrics()
+            self.stdout.write('Метрики обнулены')
@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import routers
+from core.database import copy_database
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную базу SQLite в файл реплики'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Повторять каждые N секунд; 0 — скопировать один раз'
+        )
+
+    def handle(self, *args, **options):
+        alias = settings.REPLICA_DATABASE
+        if alias is None:
+            raise CommandError(
+                'Реплика не настроена: задайте DATABASE_REPLICA'
+            )
+        source = settings.DATABASES['default']['NAME']
+        target = settings.DATABASES[alias]['NAME']
+        while True:
+            started = time.time()
+            copy_database(source, target)
+            # Страницы, не менявшиеся с начала копии, можно читать из реплики
+            routers.mark_synced(started)
+            self.stdout.write(f'{source} -> {target}')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,54 @@
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Приращения метрик текущего запроса; их копит batch_metrics
+_state = threading.local()
+
+
+def write_metrics(deltas):
+    """Прибавляет приращения к счётчикам в кэше: одно чтение и одна запись.
+
+    Одновременные запросы могут перезаписать приращения друг друга,
+    так что счётчики приблизительные — для диагностики этого хватает.
+    """
+    if not deltas:
+        return
+    found = cache.get_many(list(deltas))
+    cache.set_many(
+        {key: found.get(key, 0) + delta for key, delta in deltas.items()},
+        timeout=None
+    )
+
+
+def add_to_metric(key, delta):
+    pending = getattr(_state, 'pending', None)
+    if pending is None:
+        # Вне запроса (команды, воркеры) пишем сразу
+        write_metrics({key: delta})
+        return
+    pending[key] = pending.get(key, 0) + delta
+
+
+@contextmanager
+def batch_metrics():
+    """Копит метрики запроса и записывает их в кэш один раз в конце.
+
+    Учитывается примерно каждый METRICS_SAMPLE_EVERY-й запрос, а его
+    приращения умножаются на это число.
+    """
+    _state.pending = {}
+    try:
+        yield
+    finally:
+        pending, _state.pending = _state.pending, None
+        every = settings.METRICS_SAMPLE_EVERY
+        if every <= 1:
+            write_metrics(pending)
+        elif random.randrange(every) == 0:
+            write_metrics({
+                key: delta * every for key, delta in pending.items()
+            })
@@ -0,0 +1,149 @@
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+
+from . import routers
+from .database import record_latency
+from .metrics import batch_metrics
+from .profiling import profile_queries
+
+logger = logging.getLogger(__name__)
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return request.path
+    return match.view_name
+
+
+def call_on_close(response, callback):
+    """Вызывает callback, когда сервер закроет ответ.
+
+    Тело потокового ответа читается уже после выхода из middleware,
+    и его запросы выполняются позже.
+    """
+    close = response.close
+
+    def close_and_call():
+        try:
+            close()
+        finally:
+            callback()
+
+    response.close = close_and_call
+
+
+def add_profile_headers(response, profile):
+    response['X-Query-Count'] = profile.count
+    response['X-Query-Time-Ms'] = f'{profile.duration * 1000:.1f}'
+    response['X-Query-Read-Ms'] = f'{profile.read_duration * 1000:.1f}'
+    response['X-Query-Write-Ms'] = f'{profile.write_duration * 1000:.1f}'
+    response['X-Query-Duplicates'] = sum(profile.duplicates.values())
+
+
+def log_profile(view_name, profile):
+    budget = settings.QUERY_BUDGETS.get(view_name)
+    # В продакшене в журнал по умолчанию попадают только превышения
+    level = logging.DEBUG
+    if budget is not None and profile.count > budget:
+        level = logging.WARNING
+    logger.log(
+        level,
+        '%s: %d запросов за %.1f мс (чтение %.1f, запись %.1f), '
+        'повторов %d, бюджет %s',
+        view_name,
+        profile.count,
+        profile.duration * 1000,
+        profile.read_duration * 1000,
+        profile.write_duration * 1000,
+        sum(profile.duplicates.values()),
+        budget
+    )
+
+
+class QueryProfilerMiddleware:
+    """Считает SQL-запросы каждого представления.
+
+    Время чтения и записи копится в гистограмме задержек (db_stats).
+    В режиме отладки итоги уходят в заголовки ответа, иначе в журнал
+    на уровне DEBUG; превышение бюджета из QUERY_BUDGETS журналируется
+    как предупреждение. Потоковый ответ учитывается целиком: итоги
+    подводятся, когда сервер его закроет, и уходят в журнал.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Метрики кэша и задержек уходят в кэш одной записью за запрос
+        metrics = ExitStack()
+        metrics.enter_context(batch_metrics())
+        queries = ExitStack()
+        profile = queries.enter_context(profile_queries())
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            queries.close()
+            metrics.close()
+            raise
+        view_name = get_view_name(request)
+        response.query_profile = profile
+        response.view_name = view_name
+
+        def finish():
+            queries.close()
+            record_latency(profile)
+            metrics.close()
+            if settings.DEBUG and not response.streaming:
+                add_profile_headers(response, profile)
+            else:
+                log_profile(view_name, profile)
+
+        if response.streaming:
+            call_on_close(response, finish)
+        else:
+            finish()
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """Направляет чтение страниц из READ_REPLICA_VIEWS в реплику.
+
+    После записи, которую сделал сам пользователь, ответ ставит куку,
+    и следующие REPLICA_STICKY_SECONDS секунд этот клиент читает из
+    основной базы: свою запись, комментарий или подписку он увидит сразу.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routers.reset()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            routers.reset()
+            raise
+        if routers.should_stick(request.method):
+            response.set_cookie(
+                settings.REPLICA_STICKY_COOKIE,
+                '1',
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True
+            )
+        if response.streaming:
+            # Тело потока читает базу по тем же правилам маршрутизации
+            call_on_close(response, routers.reset)
+        else:
+            routers.reset()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            request.method in ('GET', 'HEAD')
+            and settings.REPLICA_STICKY_COOKIE not in request.COOKIES
+            and get_view_name(request) in settings.READ_REPLICA_VIEWS
+        ):
+            routers.use_replica()
@@ -0,0 +1,62 @@
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+
+def query_kind(sql):
+    """Чтение или запись: от этого зависит, ждёт ли запрос блокировку."""
+    return 'read' if sql.lstrip()[:6].upper() == 'SELECT' else 'write'
+
+
+class QueryProfile:
+    """Число, суммарное время и повторы SQL-запросов за время запроса.
+
+    Длительности отдельных запросов собираются в timings
+    раздельно для чтения и записи.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.signatures = Counter()
+        self.timings = {'read': [], 'write': []}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.duration += elapsed
+            self.timings[query_kind(sql)].append(elapsed)
+            self.count += 1
+            # Параметры передаются отдельно, так что текст запроса
+            # и есть его подпись: N+1 даёт одинаковые тексты.
+            self.signatures[sql] += 1
+
+    @property
+    def read_duration(self):
+        return sum(self.timings['read'])
+
+    @property
+    def write_duration(self):
+        return sum(self.timings['write'])
+
+    @property
+    def duplicates(self):
+        return {
+            sql: count
+            for sql, count in self.signatures.items()
+            if count > 1
+        }
+
+
+@contextmanager
+def profile_queries():
+    profile = QueryProfile()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(profile))
+        yield profile
@@ -0,0 +1,94 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Состояние текущего запроса; его ведёт ReplicaRoutingMiddleware
+_state = threading.local()
+
+# Когда началась последняя копия реплики; пишет sync_replica
+SYNCED_KEY = 'replica_synced_at'
+# Методы, которые сами по себе данных пользователя не меняют
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+# Правку отмечают в кэше ещё до коммита, с точностью до секунды:
+# запас на округление и на саму транзакцию
+COMMIT_MARGIN = 2
+
+
+def reset():
+    _state.replica = False
+    _state.wrote = False
+    _state.user_write = False
+
+
+def use_replica():
+    _state.replica = True
+
+
+def wrote():
+    return getattr(_state, 'wrote', False)
+
+
+def mark_user_write():
+    """Отмечает GET-представление, которое меняет данные по просьбе
+    пользователя (подписка): его запись тоже закрепляет основную базу."""
+    _state.user_write = True
+
+
+def should_stick(method):
+    """Закреплять ли клиента за основной базой после этого запроса.
+
+    Служебные записи при чтении, например ленивый пересчёт счётчиков
+    на странице профиля, не в счёт: иначе кука ставилась бы на GET.
+    """
+    if not wrote():
+        return False
+    return method not in SAFE_METHODS or getattr(_state, 'user_write', False)
+
+
+def mark_synced(started):
+    cache.set(SYNCED_KEY, started, timeout=None)
+
+
+def skip_stale_replica(modified):
+    """Возвращает чтение в основную базу, если реплику копировали
+    раньше последней правки страницы.
+
+    Иначе страница из реплики ушла бы под новым ETag со старым
+    содержимым и осталась бы в кэше страниц.
+    """
+    if not getattr(_state, 'replica', False):
+        return
+    synced = cache.get(SYNCED_KEY)
+    if synced is None or modified > synced - COMMIT_MARGIN:
+        _state.replica = False
+
+
+class PrimaryReplicaRouter:
+    """Чтение из реплики REPLICA_DATABASE, запись — только в основную базу.
+
+    Реплика включается лишь на время запроса к странице из
+    READ_REPLICA_VIEWS; вне запросов (команды, воркеры) и внутри
+    транзакций всё читается из основной базы.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = settings.REPLICA_DATABASE
+        if alias is None or not getattr(_state, 'replica', False):
+            return None
+        # В транзакции читаем то же, что собираемся менять
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # В реплике те же данные, что и в основной базе
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
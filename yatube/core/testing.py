@@ -0,0 +1,43 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+@contextmanager
+def run_on_commit(using=DEFAULT_DB_ALIAS):
+    """Выполняет колбэки on_commit, отложенные внутри блока.
+
+    TestCase не коммитит транзакцию, и без этого они бы не сработали.
+    """
+    connection = connections[using]
+    start = len(connection.run_on_commit)
+    try:
+        yield
+    finally:
+        while len(connection.run_on_commit) > start:
+            _, callback = connection.run_on_commit.pop(start)
+            callback()
+
+
+class QueryBudgetMixin:
+    """Проверки для TestCase: представление укладывается в свой бюджет."""
+
+    def assertWithinQueryBudget(self, response, allow_duplicates=False):
+        profile = response.query_profile
+        budget = settings.QUERY_BUDGETS.get(response.view_name)
+        self.assertIsNotNone(
+            budget, f'Для {response.view_name} не задан бюджет запросов'
+        )
+        self.assertLessEqual(
+            profile.count,
+            budget,
+            f'{response.view_name}: {profile.count} запросов '
+            f'при бюджете {budget}'
+        )
+        if not allow_duplicates:
+            self.assertEqual(
+                profile.duplicates,
+                {},
+                f'{response.view_name}: повторяющиеся запросы'
+            )
@@ -1,3 +1,179 @@
+import os
+import sqlite3
+import tempfile
+import time
+from unittest import mock
 
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from core import metrics, routers
+from core.database import copy_database
+from posts.models import Post, UserStats
+
+User = get_user_model()
+
+
+@override_settings(REPLICA_DATABASE='replica')
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+        routers.reset()
+        self.addCleanup(routers.reset)
+
+    def test_reads_use_replica_only_when_enabled(self):
+        self.assertIsNone(self.router.db_for_read(Post))
+        routers.use_replica()
+        self.assertEqual(self.router.db_for_read(Post), 'replica')
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+        self.assertTrue(routers.wrote())
+
+    def test_replica_older_than_page_is_skipped(self):
+        cache.delete(routers.SYNCED_KEY)
+        self.addCleanup(cache.delete, routers.SYNCED_KEY)
+        now = time.time()
+        cases = (
+            (None, False),
+            (now - 60, False),
+            (now + routers.COMMIT_MARGIN + 1, True),
+        )
+        for synced, replica in cases:
+            with self.subTest(synced=synced):
+                if synced is not None:
+                    routers.mark_synced(synced)
+                routers.use_replica()
+                routers.skip_stale_replica(int(now))
+                self.assertEqual(
+                    self.router.db_for_read(Post) == 'replica', replica
+                )
+
+    def test_transactions_read_from_primary(self):
+        routers.use_replica()
+        with mock.patch.object(
+            connections[DEFAULT_DB_ALIAS], 'in_atomic_block', True
+        ):
+            self.assertIsNone(self.router.db_for_read(Post))
+
+    @override_settings(REPLICA_DATABASE=None)
+    def test_without_replica_everything_stays_on_primary(self):
+        routers.use_replica()
+        self.assertIsNone(self.router.db_for_read(Post))
+
+
+class MetricsBatchTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_request_metrics_are_written_once(self):
+        with mock.patch.object(
+            cache, 'set_many', wraps=cache.set_many
+        ) as set_many:
+            with metrics.batch_metrics():
+                metrics.add_to_metric('hits', 1)
+                metrics.add_to_metric('hits', 2)
+                metrics.add_to_metric('misses', 1)
+                self.assertIsNone(cache.get('hits'))
+        set_many.assert_called_once()
+        self.assertEqual(
+            cache.get_many(['hits', 'misses']), {'hits': 3, 'misses': 1}
+        )
+
+    @override_settings(METRICS_SAMPLE_EVERY=4)
+    def test_sampled_requests_are_weighted(self):
+        for choice in (1, 0):
+            with mock.patch.object(
+                metrics.random, 'randrange', return_value=choice
+            ):
+                with metrics.batch_metrics():
+                    metrics.add_to_metric('hits', 1)
+        self.assertEqual(cache.get('hits'), 4)
+
+
+class ReplicaRoutingMiddlewareTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='writer')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_feed_reads_go_to_replica(self):
+        with mock.patch.object(
+            routers, 'use_replica', wraps=routers.use_replica
+        ) as use_replica:
+            self.client.get(reverse('index'))
+            use_replica.assert_called_once()
+            self.client.get(reverse('new_post'))
+            use_replica.assert_called_once()
+
+    def test_writer_sticks_to_primary(self):
+        response = self.client.post(reverse('new_post'), {'text': 'Новая'})
+        cookie = response.cookies[settings.REPLICA_STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_STICKY_SECONDS)
+        with mock.patch.object(routers, 'use_replica') as use_replica:
+            self.client.get(reverse('index'))
+            use_replica.assert_not_called()
+
+    def test_reads_do_not_set_sticky_cookie(self):
+        response = self.client.get(reverse('index'))
+        self.assertNotIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+
+    def test_lazy_writes_on_read_do_not_stick(self):
+        author = User.objects.create_user(username='author')
+        # Первое чтение досоздаёт счётчики и выходит за бюджет профиля
+        with self.assertLogs('core.middleware', 'WARNING'):
+            response = self.client.get(reverse('profile', args=['author']))
+        self.assertTrue(UserStats.objects.filter(user=author).exists())
+        self.assertNotIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+
+    def test_follow_sticks_to_primary(self):
+        User.objects.create_user(username='author')
+        response = self.client.get(
+            reverse('profile_follow', args=['author'])
+        )
+        self.assertIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+
+
+class StreamingResponseTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(username='writer')
+        Post.objects.create(text='Запись', author=author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_stream_is_profiled_and_routed_until_closed(self):
+        with mock.patch.object(
+            routers, 'reset', wraps=routers.reset
+        ) as reset:
+            response = self.client.get(reverse('index_feed', args=['atom']))
+            self.assertTrue(response.streaming)
+            reset.assert_called_once()
+            before = response.query_profile.count
+            b''.join(response.streaming_content)
+            self.assertEqual(reset.call_count, 2)
+        self.assertGreater(response.query_profile.count, before)
+
+
+class CopyDatabaseTest(TestCase):
+    def test_replica_gets_primary_rows(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        source = os.path.join(directory.name, 'primary.sqlite3')
+        target = os.path.join(directory.name, 'replica.sqlite3')
+        with sqlite3.connect(source) as connection:
+            connection.execute('CREATE TABLE post (text TEXT)')
+            connection.execute("INSERT INTO post VALUES ('запись')")
+        connection.close()
+        copy_database(source, target)
+        replica = sqlite3.connect(target)
+        self.addCleanup(replica.close)
+        self.assertEqual(
+            replica.execute('SELECT text FROM post').fetchall(),
+            [('запись',)]
+        )
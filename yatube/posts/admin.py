@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Post, Group, Follow
+from .search import get_search_backend
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -8,6 +9,13 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Ищем по индексу вместо LIKE '%...%' по всей таблице
+        if not search_term:
+            return queryset, False
+        backend = get_search_backend()
+        return backend.filter_posts(queryset, search_term), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('title', 'slug', 'description')
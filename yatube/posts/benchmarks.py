@@ -0,0 +1,208 @@
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count
+from django.urls import reverse
+
+from yatube.settings import POSTS_PAGINATOR_COUNT
+
+from .models import Group, Post, UserStats
+from .timelines import follow_summary
+
+User = get_user_model()
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, rank):
+    """Перцентиль по ближайшему рангу, как в нагрузочных отчётах."""
+    ordered = sorted(values)
+    index = max(math.ceil(rank / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+def last_page(count):
+    return max(math.ceil(count / POSTS_PAGINATOR_COUNT), 1)
+
+
+def feed_targets():
+    """Страницы для замера: первая и самая глубокая страница каждой ленты.
+
+    Группа, автор и запись берутся самые наполненные, а читатель —
+    подписанный на наибольшее число авторов.
+    """
+    group = Group.objects.annotate(
+        total=Count('posts')
+    ).order_by('-total').first()
+    author_stats = UserStats.objects.select_related('user')
+    author = author_stats.order_by('-posts').first()
+    reader = author_stats.order_by('-following').first()
+    post = Post.objects.annotate(
+        total=Count('comments')
+    ).order_by('-total').select_related('author').first()
+    feeds = {
+        'index': (reverse('index'), Post.objects.count()),
+        'group_posts': (
+            reverse('group_posts', kwargs={'slug': group.slug}),
+            group.total
+        ),
+        'profile': (
+            reverse('profile', kwargs={'username': author.user.username}),
+            author.posts
+        ),
+        'follow_index': (
+            reverse('follow_index'),
+            # Число записей берётся так же, как у TimelinePaginator:
+            # готовая лента может быть неполной
+            follow_summary(reader.user)[0]
+        ),
+    }
+    targets = {}
+    for name, (url, count) in feeds.items():
+        targets[f'{name}:shallow'] = f'{url}?page=1'
+        targets[f'{name}:deep'] = f'{url}?page={last_page(count)}'
+    targets['post_view'] = reverse(
+        'post_view',
+        kwargs={'username': post.author.username, 'post_id': post.pk}
+    )
+    return reader.user, targets
+
+
+def measure(client, url, repeat, warmup=1):
+    """Время ответов в миллисекундах и число SQL-запросов последнего."""
+    for _ in range(warmup):
+        client.get(url)
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - start) * 1000)
+        queries = response.query_profile.count
+        if response.status_code != 200:
+            raise RuntimeError(f'{url} ответил {response.status_code}')
+    result = {
+        f'p{rank}_ms': round(percentile(timings, rank), 2)
+        for rank in PERCENTILES
+    }
+    result['queries'] = queries
+    return result
+
+
+def compare(baseline, results, threshold):
+    """Строки отчёта и список регрессий относительно базового замера.
+
+    Регрессия — рост p95 больше чем на threshold процентов
+    или любой рост числа запросов.
+    """
+    lines = []
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            lines.append(f'{name}: нет в базовом замере')
+            continue
+        before, after = previous['p95_ms'], current['p95_ms']
+        change = (after - before) / before * 100 if before else 0
+        lines.append(
+            f'{name}: p95 {before} -> {after} мс ({change:+.1f}%), '
+            f'запросов {previous["queries"]} -> {current["queries"]}'
+        )
+        if change > threshold or current['queries'] > previous['queries']:
+            regressions.append(name)
+    return lines, regressions
+
+
+# Режим SQLite по умолчанию: журнал отката и fsync на каждую транзакцию
+DEFAULT_PRAGMAS = {'journal_mode': 'delete', 'synchronous': 'full'}
+READ_SQL = 'SELECT id, text FROM post ORDER BY pub_date DESC LIMIT 10'
+
+
+def open_sqlite(path, pragmas):
+    connection = sqlite3.connect(
+        path, timeout=5, isolation_level=None, check_same_thread=False
+    )
+    for name, value in pragmas.items():
+        connection.execute(f'PRAGMA {name} = {value}')
+    return connection
+
+
+def write_loop(connection, stop, batch, counter):
+    """Пишет пачками, как add_comment и new_post под нагрузкой."""
+    while not stop.is_set():
+        connection.execute('BEGIN IMMEDIATE')
+        connection.executemany(
+            'INSERT INTO post (text, pub_date) VALUES (?, ?)',
+            [('запись', time.time())] * batch
+        )
+        connection.execute('COMMIT')
+        counter.append(batch)
+
+
+def read_loop(connection, stop, timings, errors):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            connection.execute(READ_SQL).fetchall()
+        except sqlite3.OperationalError:
+            errors.append(1)
+            continue
+        timings.append((time.perf_counter() - start) * 1000)
+
+
+def sqlite_concurrency(pragmas, duration=2.0, readers=4, rows=5000,
+                       batch=50):
+    """Задержки чтения ленты, пока параллельно идёт непрерывная запись.
+
+    База — временный файл, так что замер не трогает рабочие данные;
+    сравнивать стоит разные pragmas на одной машине.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'concurrency.sqlite3')
+        setup = open_sqlite(path, pragmas)
+        setup.execute(
+            'CREATE TABLE post (id INTEGER PRIMARY KEY, text TEXT, '
+            'pub_date REAL)'
+        )
+        setup.execute('CREATE INDEX post_pub_date ON post (pub_date)')
+        setup.executemany(
+            'INSERT INTO post (text, pub_date) VALUES (?, ?)',
+            [('запись', number) for number in range(rows)]
+        )
+        setup.close()
+        stop = threading.Event()
+        timings, errors, written = [], [], []
+        connections = [open_sqlite(path, pragmas) for _ in range(readers + 1)]
+        threads = [threading.Thread(
+            target=write_loop, args=(connections[0], stop, batch, written)
+        )] + [
+            threading.Thread(
+                target=read_loop,
+                args=(connection, stop, timings, errors)
+            )
+            for connection in connections[1:]
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        for connection in connections:
+            connection.close()
+    result = {
+        f'p{rank}_ms': round(percentile(timings, rank), 3)
+        for rank in PERCENTILES
+    }
+    result.update({
+        'max_ms': round(max(timings), 3),
+        'reads': len(timings),
+        'rows_written': sum(written),
+        'read_errors': len(errors),
+    })
+    return result
@@ -0,0 +1,117 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Page
+from django.db import transaction
+
+from core.metrics import add_to_metric
+
+INDEX_VERSION_KEY = 'index_page_version'
+
+# Что учитываем в метриках попаданий: страницы, счётчики, миниатюры
+CACHE_METRICS = ('index_page', 'post_count', 'thumbnail')
+
+
+def get_ttl(view_name):
+    return settings.CACHE_TTLS[view_name]
+
+
+def metric_key(name, outcome):
+    return f'cache_metrics:{name}:{outcome}'
+
+
+def count_lookups(name, hits=0, misses=0):
+    """Учитывает попадания и промахи в общем кэше всех воркеров."""
+    if not settings.CACHE_METRICS:
+        return
+    if hits:
+        add_to_metric(metric_key(name, 'hits'), int(hits))
+    if misses:
+        add_to_metric(metric_key(name, 'misses'), int(misses))
+
+
+def get_cache_metrics():
+    """Возвращает {имя: (попадания, промахи)} по всем метрикам."""
+    keys = [
+        metric_key(name, outcome)
+        for name in CACHE_METRICS
+        for outcome in ('hits', 'misses')
+    ]
+    found = cache.get_many(keys)
+    return {
+        name: (
+            found.get(metric_key(name, 'hits'), 0),
+            found.get(metric_key(name, 'misses'), 0)
+        )
+        for name in CACHE_METRICS
+    }
+
+
+def reset_cache_metrics():
+    cache.delete_many([
+        metric_key(name, outcome)
+        for name in CACHE_METRICS
+        for outcome in ('hits', 'misses')
+    ])
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Начинаем с отметки времени, чтобы после вытеснения ключа
+        # не подхватить страницы, закэшированные под старой версией.
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Ключа нет: следующее чтение само начнёт новую версию.
+        pass
+
+
+def parse_page_number(page_number):
+    try:
+        return max(int(page_number), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def get_cached_page(name, version, paginator, page_number, timeout):
+    """Страница ленты из кэша: хранятся только её записи."""
+    number = parse_page_number(page_number)
+    key = f'{name}:{version}:{number}'
+    cached = cache.get(key)
+    count_lookups(name, hits=cached is not None, misses=cached is None)
+    if cached is None:
+        page = paginator.get_page(number)
+        object_list = list(page.object_list)
+        cache.set(key, (page.number, object_list), timeout)
+        page.object_list = object_list
+        return page
+    number, object_list = cached
+    return Page(object_list, number, paginator)
+
+
+def get_index_page(paginator, page_number):
+    version = get_version(INDEX_VERSION_KEY)
+    return get_cached_page(
+        'index_page',
+        version,
+        paginator,
+        page_number,
+        get_ttl('index')
+    )
+
+
+def invalidate_index():
+    """Сбрасывает кэш главной после коммита текущей транзакции.
+
+    Иначе параллельный запрос успел бы закэшировать под новой версией
+    ещё старые записи.
+    """
+    transaction.on_commit(lambda: bump_version(INDEX_VERSION_KEY))
@@ -0,0 +1,114 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from core import routers
+
+from .caching import bump_version, get_version
+from .counters import post_scopes
+
+# Общая область: её правка (например, название группы на карточках)
+# меняет все страницы сразу
+SITE = 'site'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def follower_scope(user_id):
+    return f'follower:{user_id}'
+
+
+def version_key(scope):
+    return f'content_version:{scope}'
+
+
+def modified_key(scope):
+    return f'content_modified:{scope}'
+
+
+def mark_changed(*scopes):
+    """Отмечает, что содержимое областей изменилось.
+
+    Отметка ставится после коммита: иначе параллельный запрос получит
+    новые ETag и Last-Modified вместе со старыми данными и закэширует их.
+    """
+    def touch():
+        now = int(time.time())
+        for scope in scopes:
+            bump_version(version_key(scope))
+        cache.set_many(
+            {modified_key(scope): now for scope in scopes}, timeout=None
+        )
+
+    transaction.on_commit(touch)
+
+
+def mark_post_changed(post_id, author_id, group_id):
+    mark_changed(post_scope(post_id), *post_scopes(author_id, group_id))
+
+
+def get_state(scopes):
+    """Версии и время последней правки областей одним чтением из кэша."""
+    scopes = (SITE,) + tuple(scopes)
+    keys = [modified_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    missing = {key: int(time.time()) for key in keys if key not in found}
+    if missing:
+        # Правки до вытеснения ключа неизвестны: считаем, что были сейчас
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+    version_keys = [version_key(scope) for scope in scopes]
+    versions = cache.get_many(version_keys)
+    return (
+        [versions.get(key) or get_version(key) for key in version_keys],
+        max(found.values())
+    )
+
+
+def make_etag(request, versions):
+    # Страница зависит ещё и от зрителя, адреса и выпуска шаблонов
+    parts = [settings.ETAG_SALT, request.get_full_path(), request.user.pk]
+    parts.extend(versions)
+    value = ':'.join(str(part) for part in parts)
+    return quote_etag(hashlib.md5(value.encode()).hexdigest())
+
+
+def conditional_page(get_scopes):
+    """Отвечает 304, если ни одна из областей страницы не менялась.
+
+    get_scopes(request, **kwargs) возвращает области страницы или None,
+    если объекта нет: тогда представление само ответит 404.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            scopes = get_scopes(request, *args, **kwargs)
+            if scopes is None:
+                return view(request, *args, **kwargs)
+            versions, modified = get_state(scopes)
+            # Реплика старше правки отдала бы старое под новым ETag
+            routers.skip_stale_replica(modified)
+            etag = make_etag(request, versions)
+            # Пригодится представлению как ключ кэша всей страницы
+            request.page_etag = etag
+            response = get_conditional_response(
+                request, etag=etag, last_modified=modified
+            )
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response.setdefault('ETag', etag)
+                response.setdefault('Last-Modified', http_date(modified))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,60 @@
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+
+from .caching import count_lookups
+
+ALL_POSTS = 'all'
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def post_scopes(author_id, group_id):
+    scopes = [ALL_POSTS, author_scope(author_id)]
+    if group_id is not None:
+        scopes.append(group_scope(group_id))
+    return scopes
+
+
+def counter_key(scope):
+    return f'post_count:{scope}'
+
+
+def get_post_count(scope, posts):
+    """Число записей ленты из хранилища счётчиков.
+
+    При промахе считаем один раз через COUNT(*), дальше счётчик
+    поддерживается сигналами создания и удаления записей.
+    """
+    key = counter_key(scope)
+    count = cache.get(key)
+    count_lookups('post_count', hits=count is not None, misses=count is None)
+    if count is None:
+        count = posts.count()
+        cache.add(key, count, timeout=None)
+    return count
+
+
+def change_post_counts(scopes, delta):
+    for scope in scopes:
+        try:
+            cache.incr(counter_key(scope), delta)
+        except ValueError:
+            # Счётчик ещё не заведён — его посчитает первое чтение.
+            pass
+
+
+class CountedPaginator(Paginator):
+    def __init__(self, object_list, per_page, count_scope, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_scope = count_scope
+
+    @cached_property
+    def count(self):
+        return get_post_count(self.count_scope, self.object_list)
@@ -0,0 +1,161 @@
+import json
+from itertools import chain
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import Truncator
+
+ATOM_CONTENT_TYPE = 'application/atom+xml; charset=utf-8'
+JSON_CONTENT_TYPE = 'application/feed+json; charset=utf-8'
+JSON_FEED_VERSION = 'https://jsonfeed.org/version/1.1'
+
+# Сколько записей тянуть из базы за раз при обходе ленты
+FEED_CHUNK = 100
+
+
+class FeedFormatConverter:
+    regex = 'atom|json'
+
+    def to_python(self, value):
+        return value
+
+    def to_url(self, value):
+        return value
+
+
+def feed_posts(posts):
+    """Итератор по записям ленты: в памяти только одна пачка строк."""
+    return (
+        posts.select_related('author', 'group')
+        .order_by('-pub_date')[:settings.FEED_MAX_ITEMS]
+        .iterator(chunk_size=FEED_CHUNK)
+    )
+
+
+def post_url(request, post):
+    return request.build_absolute_uri(reverse(
+        'post_view',
+        kwargs={'username': post.author.username, 'post_id': post.pk}
+    ))
+
+
+def profile_url(request, user):
+    return request.build_absolute_uri(
+        reverse('profile', kwargs={'username': user.username})
+    )
+
+
+def atom_entry(request, post):
+    url = post_url(request, post)
+    title = Truncator(post.text).chars(60)
+    category = ''
+    if post.group is not None:
+        category = f'<category term={quoteattr(post.group.title)}/>'
+    return (
+        '<entry>'
+        f'<title>{escape(title)}</title>'
+        f'<link href={quoteattr(url)}/>'
+        f'<id>{escape(url)}</id>'
+        f'<updated>{post.pub_date.isoformat()}</updated>'
+        f'<author><name>{escape(post.author.username)}</name>'
+        f'<uri>{escape(profile_url(request, post.author))}</uri></author>'
+        f'{category}'
+        f'<content type="text">{escape(post.text)}</content>'
+        '</entry>\n'
+    )
+
+
+def atom_chunks(request, title, link, posts):
+    posts = feed_posts(posts)
+    # Дата обновления ленты нужна в заголовке, до первой записи
+    first = next(posts, None)
+    updated = first.pub_date if first is not None else timezone.now()
+    yield (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<feed xmlns="http://www.w3.org/2005/Atom">\n'
+        f'<title>{escape(title)}</title>'
+        f'<link href={quoteattr(link)} rel="alternate"/>'
+        f'<link href={quoteattr(request.build_absolute_uri())} rel="self"/>'
+        f'<id>{escape(link)}</id>'
+        f'<updated>{updated.isoformat()}</updated>\n'
+    )
+    if first is not None:
+        for post in chain([first], posts):
+            yield atom_entry(request, post)
+    yield '</feed>\n'
+
+
+def json_item(request, post):
+    url = post_url(request, post)
+    item = {
+        'id': url,
+        'url': url,
+        'content_text': post.text,
+        'date_published': post.pub_date.isoformat(),
+        'authors': [{
+            'name': post.author.username,
+            'url': profile_url(request, post.author),
+        }],
+    }
+    if post.group is not None:
+        item['tags'] = [post.group.title]
+    if post.image:
+        item['image'] = request.build_absolute_uri(post.image.url)
+    return json.dumps(item, ensure_ascii=False)
+
+
+def json_chunks(request, title, link, posts):
+    header = json.dumps({
+        'version': JSON_FEED_VERSION,
+        'title': title,
+        'home_page_url': link,
+        'feed_url': request.build_absolute_uri(),
+    }, ensure_ascii=False)
+    # Открываем массив items прямо в заголовке и закрываем в конце
+    yield header[:-1] + ', "items": [\n'
+    for number, post in enumerate(feed_posts(posts)):
+        yield (',\n' if number else '') + json_item(request, post)
+    yield '\n]}\n'
+
+
+def caching_stream(key, chunks):
+    """Отдаёт куски по мере готовности.
+
+    Ленту не больше FEED_CACHE_MAX_BYTES после отдачи кладёт в кэш
+    целиком, крупную не копит.
+    """
+    parts = []
+    size = 0
+    for chunk in chunks:
+        data = chunk.encode()
+        if parts is not None:
+            size += len(data)
+            parts.append(data)
+            if size > settings.FEED_CACHE_MAX_BYTES:
+                parts = None
+        yield data
+    if parts is not None:
+        cache.set(key, b''.join(parts), settings.CACHE_TTLS['feed'])
+
+
+def feed_response(request, feed_format, title, link, posts):
+    """Лента в формате Atom или JSON Feed, потоком или из кэша."""
+    link = request.build_absolute_uri(link)
+    if feed_format == 'atom':
+        chunks, content_type = atom_chunks, ATOM_CONTENT_TYPE
+    else:
+        chunks, content_type = json_chunks, JSON_CONTENT_TYPE
+    # ETag страницы уже учитывает версии её областей и адрес,
+    # а абсолютные ссылки в ленте зависят ещё и от хоста
+    key = f'feed:{request.get_host()}:{request.page_etag}'
+    body = cache.get(key)
+    if body is not None:
+        return HttpResponse(body, content_type=content_type)
+    return StreamingHttpResponse(
+        caching_stream(key, chunks(request, title, link, posts)),
+        content_type=content_type
+    )
@@ -0,0 +1,105 @@
+import os
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from .models import Post
+from .storage import STAGED_DIR
+
+# Сюда попадают уже обработанные картинки; их повторно не трогаем
+INGESTED_DIR = 'posts/optimized/'
+
+
+def ingest_format():
+    return ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+
+
+def recompress(file):
+    """Уменьшает картинку до IMAGE_MAX_SIZE и пережимает без метаданных.
+
+    Поворот из EXIF применяется к пикселям до того, как EXIF
+    отбрасывается, так что снимки с телефона не ложатся набок.
+    """
+    image_format, extension = ingest_format()
+    with Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(settings.IMAGE_MAX_SIZE, Image.LANCZOS)
+        has_alpha = image.mode in ('RGBA', 'LA', 'P')
+        if image_format == 'WEBP' and has_alpha:
+            image = image.convert('RGBA')
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        buffer = BytesIO()
+        image.save(buffer, image_format, quality=settings.IMAGE_QUALITY)
+    return ContentFile(buffer.getvalue()), extension
+
+
+def save_ingested(storage, name, file):
+    """Сохраняет обработанную копию картинки и возвращает её имя."""
+    content, extension = recompress(file)
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return storage.save(f'{INGESTED_DIR}{stem}.{extension}', content)
+
+
+def stage_upload(post):
+    """Откладывает только что загруженную картинку в STAGED_DIR.
+
+    Уменьшит её и очистит от EXIF фоновая задача: в MEDIA_ROOT
+    оригинал с координатами съёмки не попадает вовсе.
+    """
+    image = post.image
+    if not image or image._committed:
+        return
+    post.image = image.storage.save(
+        f'{STAGED_DIR}{os.path.basename(image.name)}', image
+    )
+
+
+def ingest_image(post):
+    """Заменяет отложенную загрузку или старый, загруженный до обработки
+    оригинал записи обработанной копией.
+
+    Возвращает True, если картинка заменена. Исходный файл удаляется,
+    только если на него больше не ссылается ни одна запись.
+    """
+    name = post.image.name
+    if name.startswith(INGESTED_DIR):
+        return False
+    storage = post.image.storage
+    with storage.open(name, 'rb') as file:
+        new_name = save_ingested(storage, name, file)
+    # Если картинку успели заменить, обработает её следующая задача
+    if not Post.objects.filter(pk=post.pk, image=name).update(image=new_name):
+        storage.delete(new_name)
+        return False
+    post.image.name = new_name
+    if not Post.objects.filter(image=name).exists():
+        storage.delete(name)
+    return True
+
+
+def sweep_staged():
+    """Удаляет отложенные загрузки, которые не достались ни одной записи.
+
+    Так бывает, если транзакция с записью откатилась; свежие файлы
+    не трогаем — их запись может быть ещё не закоммичена.
+    """
+    storage = default_storage
+    if not storage.exists(STAGED_DIR):
+        return 0
+    names = [f'{STAGED_DIR}{name}' for name in storage.listdir(STAGED_DIR)[1]]
+    used = set(
+        Post.objects.filter(image__in=names).values_list('image', flat=True)
+    )
+    cutoff = timezone.now() - timedelta(seconds=settings.STAGED_UPLOAD_TTL)
+    removed = 0
+    for name in names:
+        if name not in used and storage.get_modified_time(name) < cutoff:
+            storage.delete(name)
+            removed += 1
+    return removed
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from sorl.thumbnail.images import deserialize_image_file
+from sorl.thumbnail.kvstores.base import KVStoreBase, add_prefix
+
+
+class PersistentFileCache(FileBasedCache):
+    """Файловый кэш без вытеснения: ключ миниатюры нужен, пока жив файл.
+
+    Заодно set() не перечисляет весь каталог, как это делает
+    проверка MAX_ENTRIES.
+    """
+
+    def _cull(self):
+        pass
+
+
+class CacheKVStore(KVStoreBase):
+    """Хранилище ключей sorl.thumbnail целиком в кэше, без базы данных.
+
+    Кэш задаётся алиасом THUMBNAIL_CACHE; для постоянного хранения
+    ему нужен бэкенд, который переживает перезапуск и ничего не
+    вытесняет (PersistentFileCache). Пропавший ключ готовой записи
+    снова ставит её в нарезку (prefetch_thumbnails).
+    Перечислять ключи кэш не умеет, поэтому cleanup() здесь ничего
+    не находит — устаревшие записи просто перезаписываются.
+    """
+
+    @property
+    def cache(self):
+        return caches[settings.THUMBNAIL_CACHE]
+
+    def get_many(self, image_files):
+        """Достаёт из хранилища сразу несколько миниатюр одним запросом."""
+        keys = {
+            add_prefix(image_file.key): image_file.key
+            for image_file in image_files
+        }
+        found = self.cache.get_many(list(keys))
+        return {
+            keys[key]: deserialize_image_file(value)
+            for key, value in found.items()
+        }
+
+    def _get_raw(self, key):
+        return self.cache.get(key)
+
+    def _set_raw(self, key, value):
+        self.cache.set(key, value, timeout=None)
+
+    def _delete_raw(self, *keys):
+        self.cache.delete_many(keys)
+
+    def _find_keys_raw(self, prefix):
+        return []
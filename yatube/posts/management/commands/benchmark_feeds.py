@@ -0,0 +1,116 @@
+import json
+import platform
+import uuid
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases,
+    teardown_test_environment
+)
+from django.utils import timezone
+
+from posts.benchmarks import compare, feed_targets, measure
+from posts.seeding import SIZES, seed
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет p50/p95/p99 и число запросов лент на синтетических '
+        'данных во временной тестовой базе'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', choices=SIZES, default='medium')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument(
+            '--output',
+            default='feeds-benchmark.json',
+            help='Куда записать результаты в JSON'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Прошлый JSON для сравнения; регрессии завершат команду '
+                 'с ошибкой'
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=10,
+            help='Допустимый рост p95 в процентах'
+        )
+        parser.add_argument(
+            '--no-cache',
+            action='store_true',
+            help='Мерить без кэша страниц и счётчиков'
+        )
+
+    def get_caches(self, no_cache):
+        if no_cache:
+            backend = 'django.core.cache.backends.dummy.DummyCache'
+            return {**settings.CACHES, 'default': {'BACKEND': backend}}
+        # Свой префикс, чтобы не смешивать замер с рабочим кэшем
+        default = {
+            **settings.CACHES['default'],
+            'KEY_PREFIX': f'benchmark-{uuid.uuid4().hex}',
+        }
+        return {**settings.CACHES, 'default': default}
+
+    def run(self, options):
+        summary = seed(
+            seed=options['seed'],
+            log=self.stdout.write,
+            **SIZES[options['size']]
+        )
+        reader, targets = feed_targets()
+        client = Client()
+        client.force_login(reader)
+        results = {}
+        for name, url in targets.items():
+            results[name] = measure(client, url, options['repeat'])
+            self.stdout.write(f'{name} {url}: {results[name]}')
+        return summary, results
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(
+                CACHES=self.get_caches(options['no_cache'])
+            ):
+                summary, results = self.run(options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'size': options['size'],
+                'seed': options['seed'],
+                'repeat': options['repeat'],
+                'cache': not options['no_cache'],
+                'rows': summary,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+        self.stdout.write(f'Результаты записаны в {options["output"]}')
+        if baseline is None:
+            return
+        lines, regressions = compare(
+            baseline['results'], results, options['threshold']
+        )
+        for line in lines:
+            self.stdout.write(line)
+        if regressions:
+            raise CommandError(f'Регрессии: {", ".join(regressions)}')
@@ -0,0 +1,39 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.benchmarks import DEFAULT_PRAGMAS, sqlite_concurrency
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает задержки чтения SQLite при параллельной записи '
+        'в режиме по умолчанию и с SQLITE_PRAGMAS'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=5)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument(
+            '--output',
+            help='Куда записать результаты в JSON'
+        )
+
+    def handle(self, *args, **options):
+        results = {}
+        modes = (
+            ('default', DEFAULT_PRAGMAS),
+            ('tuned', settings.SQLITE_PRAGMAS),
+        )
+        for name, pragmas in modes:
+            results[name] = sqlite_concurrency(
+                pragmas,
+                duration=options['duration'],
+                readers=options['readers']
+            )
+            self.stdout.write(f'{name} {pragmas}: {results[name]}')
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(f'Результаты записаны в {options["output"]}')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts.caching import get_cache_metrics, reset_cache_metrics
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания и промахи кэша лент, счётчиков и миниатюр'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Обнулить метрики после вывода'
+        )
+
+    def handle(self, *args, **options):
+        for name, (hits, misses) in get_cache_metrics().items():
+            total = hits + misses
+            ratio = hits / total * 100 if total else 0
+            self.stdout.write(
+                f'{name}: попаданий {hits}, промахов {misses}, '
+                f'доля попаданий {ratio:.1f}%'
+            )
+        if options['reset']:
+            reset_cache_metrics()
+            self.stdout.write('Метрики обнулены')
@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.writebehind import flush
+
+
+class Command(BaseCommand):
+    help = 'Переносит отложенные комментарии и подписки из очереди в базу'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Проверять очередь каждые N секунд; 0 — разобрать и выйти'
+        )
+        parser.add_argument(
+            '--batch',
+            type=int,
+            default=settings.WRITE_BEHIND_BATCH
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            count = flush(options['batch'])
+            if count:
+                self.stdout.write(f'Записано задач: {count}')
+            elif not options['interval']:
+                break
+            else:
+                time.sleep(options['interval'])
@@ -0,0 +1,27 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from posts.stats import recount_user_stats
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает подписчиков, подписки и записи пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        user_ids = User.objects.order_by('pk').values_list('pk', flat=True)
+        total = 0
+        last_pk = 0
+        while True:
+            batch = list(user_ids.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            recount_user_stats(User.objects.filter(pk__in=batch))
+            total += len(batch)
+            last_pk = batch[-1]
+        self.stdout.write(f'Пересчитано профилей: {total}')
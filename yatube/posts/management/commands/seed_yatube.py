@@ -0,0 +1,90 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.caching import invalidate_index
+from posts.conditional import SITE, mark_changed
+from posts.counters import ALL_POSTS, counter_key
+from posts.seeding import SIZES, seed
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Быстро наполняет базу синтетическими данными через bulk_create'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', choices=SIZES, default='small')
+        for name in SIZES['small']:
+            parser.add_argument(
+                f'--{name}',
+                type=int,
+                help=f'Переопределить число строк ({name}) из --size'
+            )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--prefix',
+            default='seed',
+            help='Префикс имён пользователей и адресов групп'
+        )
+        parser.add_argument(
+            '--author-exponent',
+            type=float,
+            default=1.0,
+            help='Перекос числа записей на автора (0 — поровну)'
+        )
+        parser.add_argument(
+            '--group-exponent',
+            type=float,
+            default=1.0,
+            help='Перекос записей между группами (0 — поровну)'
+        )
+        parser.add_argument(
+            '--group-ratio',
+            type=float,
+            default=0.7,
+            help='Доля записей, опубликованных в группе'
+        )
+        parser.add_argument(
+            '--follower-exponent',
+            type=float,
+            default=1.0,
+            help='Показатель степенного закона для числа подписчиков'
+        )
+        parser.add_argument(
+            '--image-ratio',
+            type=float,
+            default=0.1,
+            help='Доля записей с картинкой'
+        )
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix} уже есть, '
+                'задайте другой --prefix'
+            )
+        sizes = {
+            name: options[name] if options[name] is not None else value
+            for name, value in SIZES[options['size']].items()
+        }
+        summary = seed(
+            seed=options['seed'],
+            prefix=prefix,
+            author_exponent=options['author_exponent'],
+            group_exponent=options['group_exponent'],
+            group_ratio=options['group_ratio'],
+            follower_exponent=options['follower_exponent'],
+            image_ratio=options['image_ratio'],
+            log=self.stdout.write,
+            **sizes
+        )
+        # bulk_create обошёл сигналы: сбрасываем общий счётчик и кэш
+        # главной, счётчики новых авторов и групп ещё не заводились.
+        # Записи появились на главной, в группах и лентах сразу, поэтому
+        # ETag и Last-Modified меняем у всех страниц через общую область.
+        cache.delete(counter_key(ALL_POSTS))
+        invalidate_index()
+        mark_changed(SITE)
+        self.stdout.write(f'Готово: {summary}')
@@ -0,0 +1,86 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.core.management.base import BaseCommand
+
+from posts.images import sweep_staged
+from posts.models import Post
+from posts.thumbnails import generate_thumbnails, init_worker, mark_ready
+
+
+def warm_post(post_id, ingest=False):
+    try:
+        return generate_thumbnails(post_id, ingest), None
+    except Exception as error:
+        return None, repr(error)
+
+
+class Command(BaseCommand):
+    help = 'Нарезает недостающие миниатюры картинок записей на всех ядрах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Число процессов; 0 — нарезать в текущем процессе'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Проверить и записи, уже отмеченные готовыми'
+        )
+        parser.add_argument(
+            '--ingest',
+            action='store_true',
+            help=(
+                'Заменить старые оригиналы уменьшенными копиями без EXIF; '
+                'оригиналы удаляются'
+            )
+        )
+
+    def get_chunks(self, posts, chunk_size):
+        last_pk = 0
+        while True:
+            chunk = list(
+                posts.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:chunk_size]
+            )
+            if not chunk:
+                return
+            yield chunk
+            last_pk = chunk[-1]
+
+    def handle(self, *args, **options):
+        removed = sweep_staged()
+        if removed:
+            self.stdout.write(f'Удалено брошенных загрузок: {removed}')
+        posts = Post.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            posts = posts.filter(image_ready=False)
+        executor = None
+        mapper = map
+        if options['workers']:
+            executor = ProcessPoolExecutor(
+                max_workers=options['workers'],
+                initializer=init_worker
+            )
+            mapper = executor.map
+        done = 0
+        try:
+            for chunk in self.get_chunks(posts, options['chunk_size']):
+                warm = partial(warm_post, ingest=options['ingest'])
+                results = zip(chunk, mapper(warm, chunk))
+                for post_id, (scopes, error) in results:
+                    if error:
+                        self.stderr.write(f'Запись {post_id}: {error}')
+                    else:
+                        mark_ready(post_id, scopes)
+                        done += 1
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        self.stdout.write(f'Готово записей: {done}')
@@ -0,0 +1,40 @@
+# Generated by Django 2.2.6 on 2026-10-18 02:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_user_stats(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    UserStats = apps.get_model('posts', 'UserStats')
+    UserStats.objects.bulk_create(
+        UserStats(
+            user=user,
+            followers=user.following.count(),
+            following=user.follower.count(),
+            posts=user.posts.count()
+        )
+        for user in User.objects.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0010_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('followers', models.PositiveIntegerField(default=0)),
+                ('following', models.PositiveIntegerField(default=0)),
+                ('posts', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_user_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 2.2.6 on 2026-10-18 02:58
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    duplicates = (
+        Follow.objects.values('user', 'author')
+        .annotate(first=Min('pk'), count=Count('pk'))
+        .filter(count__gt=1)
+    )
+    for row in duplicates:
+        extra = row['count'] - 1
+        Follow.objects.filter(
+            user=row['user'],
+            author=row['author']
+        ).exclude(pk=row['first']).delete()
+        UserStats.objects.filter(user=row['author']).update(
+            followers=F('followers') - extra
+        )
+        UserStats.objects.filter(user=row['user']).update(
+            following=F('following') - extra
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_userstats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-created'], name='comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date'], name='post_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date'], name='post_group_pub_date_idx'),
+        ),
+        migrations.RunPython(
+            remove_duplicate_follows,
+            migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow'),
+        ),
+    ]
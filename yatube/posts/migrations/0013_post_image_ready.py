@@ -0,0 +1,18 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_ready',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations
+
+POST_TABLE = 'posts_post_search'
+COMMENT_TABLE = 'posts_comment_search'
+TOKENIZER = 'unicode61 remove_diacritics 2'
+
+
+def create_search_index(apps, schema_editor):
+    # Индекс FTS5 есть только у SQLite, другим базам нужен свой движок
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f'CREATE VIRTUAL TABLE {POST_TABLE} '
+        f"USING fts5(text, tokenize = '{TOKENIZER}')"
+    )
+    schema_editor.execute(
+        f'CREATE VIRTUAL TABLE {COMMENT_TABLE} '
+        f"USING fts5(post_id UNINDEXED, text, tokenize = '{TOKENIZER}')"
+    )
+    schema_editor.execute(
+        f'INSERT INTO {POST_TABLE} (rowid, text) '
+        'SELECT id, text FROM posts_post'
+    )
+    schema_editor.execute(
+        f'INSERT INTO {COMMENT_TABLE} (rowid, post_id, text) '
+        'SELECT id, post_id, text FROM posts_comment'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f'DROP TABLE IF EXISTS {POST_TABLE}')
+    schema_editor.execute(f'DROP TABLE IF EXISTS {COMMENT_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_image_ready'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
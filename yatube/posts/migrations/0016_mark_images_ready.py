@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+def mark_images_ready(apps, schema_editor):
+    # Старые картинки показывались и до фоновой нарезки; их миниатюры
+    # ставит в нарезку 0019.
+    Post = apps.get_model('posts', 'Post')
+    Post.objects.exclude(image='').exclude(image=None).update(
+        image_ready=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_post_card_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(mark_images_ready, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_mark_images_ready'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='queue_uid',
+            field=models.CharField(editable=False, max_length=32, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 2.2.6 on 2026-10-18 04:04
+
+from django.db import migrations, models
+
+
+def mark_truncated_history(apps, schema_editor):
+    # Подписки, которым при подписке досталась не вся история автора
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    for follow in Follow.objects.iterator():
+        entries = TimelineEntry.objects.filter(
+            user_id=follow.user_id, post__author_id=follow.author_id
+        ).aggregate(count=models.Count('pk'), oldest=models.Min('pub_date'))
+        if not entries['count']:
+            continue
+        posts = Post.objects.filter(author_id=follow.author_id).count()
+        if posts > entries['count']:
+            Follow.objects.filter(pk=follow.pk).update(
+                history_from=entries['oldest']
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_comment_queue_uid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='follow',
+            name='history_from',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(
+            mark_truncated_history, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def schedule_legacy_thumbnails(apps, schema_editor):
+    # 0016 отметила старые картинки готовыми, но миниатюры им никто
+    # не нарезал. Обработанные копии (posts/optimized/) нарезаны при
+    # загрузке; остальные подберёт warm_thumbnails без --all.
+    Post = apps.get_model('posts', 'Post')
+    Post.objects.exclude(image='').exclude(image=None).exclude(
+        image__startswith='posts/optimized/'
+    ).update(image_ready=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_follow_history_from'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            schedule_legacy_thumbnails, migrations.RunPython.noop
+        ),
+    ]
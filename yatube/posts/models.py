@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -13,6 +15,32 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Всё, что нужно карточке записи, одним запросом.
+
+        Комментарии считаются подзапросом, а не JOIN + GROUP BY:
+        так сортировка по дате идёт прямо по индексу ленты.
+        """
+        comments = (
+            Comment.objects.filter(post=OuterRef('pk'))
+            .order_by()
+            .values('post')
+            .annotate(count=Count('pk'))
+            .values('count')
+        )
+        return self.select_related('author', 'group').annotate(
+            comment_count=Coalesce(
+                Subquery(comments, output_field=IntegerField()),
+                0
+            )
+        )
+
+    def bump_card_version(self):
+        """Сбрасывает закэшированные карточки записей выборки."""
+        return self.update(card_version=F('card_version') + 1)
+
+
 class Post(models.Model):
     text = models.TextField()
     pub_date = models.DateTimeField(
@@ -33,12 +61,28 @@ class Post(models.Model):
         related_name='posts'
     )
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    # Миниатюры картинки уже нарезаны фоновым обработчиком
+    image_ready = models.BooleanField(default=False, editable=False)
+    # Версия карточки в ленте: часть ключа кэша её HTML
+    card_version = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.text[:15]
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date'],
+                name='post_group_pub_date_idx'
+            ),
+        ]
 
 
 class Comment(models.Model):
@@ -56,12 +100,22 @@ class Comment(models.Model):
     )
     text = models.TextField()
     created = models.DateTimeField('date_published', auto_now_add='True')
+    # Ключ задачи отложенной записи: повтор пачки не создаст дубль
+    queue_uid = models.CharField(
+        max_length=32, unique=True, null=True, editable=False
+    )
 
     def __str__(self):
         return self.text[:15]
 
     class Meta:
         ordering = ('-created',)
+        indexes = [
+            models.Index(
+                fields=['post', '-created'],
+                name='comment_post_created_idx'
+            ),
+        ]
 
 
 class Follow(models.Model):
@@ -75,6 +129,61 @@ class Follow(models.Model):
         related_name='following',
         on_delete=models.CASCADE
     )
+    # Записи автора не новее этой даты в ленту подписчика не разложены:
+    # при подписке копируются только TIMELINE_BACKFILL последних
+    history_from = models.DateTimeField(null=True, editable=False)
+
+    def __str__(self):
+        return str(self.user)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                name='unique_follow'
+            ),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """Запись ленты подписок, разложенная подписчику при публикации."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    pub_date = models.DateTimeField('date_published')
+
+    def __str__(self):
+        return f'{self.user} <- {self.post_id}'
+
+    class Meta:
+        ordering = ('-pub_date',)
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date'],
+                name='timeline_user_pub_date_idx'
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    """Счётчики профиля, которые обновляются вместе с записями и подписками."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    followers = models.PositiveIntegerField(default=0)
+    following = models.PositiveIntegerField(default=0)
+    posts = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return str(self.user)
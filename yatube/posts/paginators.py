@@ -0,0 +1,91 @@
+import base64
+import binascii
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(obj, date_field='pub_date'):
+    value = f'{getattr(obj, date_field).isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(token):
+    """Возвращает (pub_date, id) или None для испорченного курсора."""
+    try:
+        value = base64.urlsafe_b64decode(token.encode()).decode()
+        pub_date, pk = value.rsplit('|', 1)
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+class CursorPage(Page):
+    cursor_mode = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def next_cursor(self):
+        if self.object_list:
+            return encode_cursor(
+                self.object_list[-1], self.paginator.date_field
+            )
+
+    def previous_cursor(self):
+        if self.object_list:
+            return encode_cursor(
+                self.object_list[0], self.paginator.date_field
+            )
+
+
+class CursorPaginator(Paginator):
+    """Пагинация по ключу (дата, id) без COUNT(*) и OFFSET.
+
+    По умолчанию листает записи по pub_date; для других моделей
+    поле даты передаётся в date_field.
+    """
+
+    def __init__(self, object_list, per_page, date_field='pub_date',
+                 **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.date_field = date_field
+
+    def cursor_page(self, after=None, before=None):
+        after = decode_cursor(after) if after else None
+        before = decode_cursor(before) if before else None
+        field = self.date_field
+        posts = self.object_list
+        if before is not None:
+            date, pk = before
+            posts = posts.filter(
+                Q(**{f'{field}__gt': date}) | Q(**{field: date, 'pk__gt': pk})
+            ).order_by(field, 'pk')
+        else:
+            if after is not None:
+                date, pk = after
+                posts = posts.filter(
+                    Q(**{f'{field}__lt': date})
+                    | Q(**{field: date, 'pk__lt': pk})
+                )
+            posts = posts.order_by(f'-{field}', '-pk')
+        object_list = list(posts[:self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        if before is not None:
+            object_list.reverse()
+            return CursorPage(object_list, self, True, has_more)
+        return CursorPage(object_list, self, has_more, after is not None)
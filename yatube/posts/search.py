@@ -0,0 +1,301 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+
+from .models import Comment, Post
+
+POST_TABLE = 'posts_post_search'
+COMMENT_TABLE = 'posts_comment_search'
+
+# Совпадение в комментарии весит меньше, чем в самой записи
+COMMENT_WEIGHT = 0.5
+SNIPPET_TOKENS = 12
+
+# Метки совпадений из FTS5; в HTML они превращаются в <mark>
+# уже после экранирования текста, так что пользовательский ввод
+# не может подсунуть свою разметку.
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+REINDEX_CHUNK = 1000
+
+
+def parse_terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def render_marks(text):
+    html = escape(text).replace('\n', '<br>')
+    html = html.replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+    return mark_safe(html)
+
+
+def mark_terms(text, terms):
+    """Выделяет слова, начинающиеся с искомых, как это делает FTS5."""
+    if not terms:
+        return text
+    pattern = r'\b(' + '|'.join(re.escape(term) for term in terms) + r')'
+    return re.sub(
+        pattern,
+        lambda match: MARK_START + match.group(0) + MARK_END,
+        text,
+        flags=re.IGNORECASE
+    )
+
+
+class SearchResults:
+    """Ленивые результаты поиска, которые понимает Paginator.
+
+    Каждый срез — один запрос к индексу и один запрос за записями.
+    Записи приходят в порядке релевантности с полями search_text
+    и search_comment для шаблона.
+    """
+
+    def __init__(self, backend, terms):
+        self.backend = backend
+        self.terms = terms
+
+    def count(self):
+        if not self.terms:
+            return 0
+        return self.backend.count(self.terms)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        if not self.terms:
+            return []
+        offset = index.start or 0
+        hits = self.backend.hits(self.terms, offset, index.stop - offset)
+        posts = Post.objects.for_feed().in_bulk([hit[0] for hit in hits])
+        results = []
+        for post_id, text, comment in hits:
+            post = posts.get(post_id)
+            if post is None:
+                continue
+            post.search_text = render_marks(text or post.text)
+            post.search_comment = render_marks(comment) if comment else ''
+            results.append(post)
+        return results
+
+
+class SearchBackend:
+    """Интерфейс поискового движка; выбирается в SEARCH_BACKEND."""
+
+    def index_post(self, post):
+        pass
+
+    def remove_post(self, post_id):
+        pass
+
+    def index_comment(self, comment):
+        pass
+
+    def remove_comment(self, comment_id):
+        pass
+
+    def rebuild(self):
+        return 0
+
+    def count(self, terms):
+        raise NotImplementedError
+
+    def hits(self, terms, offset, limit):
+        """Список (post_id, текст с метками, фрагмент комментария)."""
+        raise NotImplementedError
+
+    def filter_matches(self, queryset, terms):
+        raise NotImplementedError
+
+    def filter_posts(self, queryset, query):
+        """Оставляет в queryset найденные записи подзапросом,
+        не вытаскивая их id в Python."""
+        terms = parse_terms(query)
+        if not terms:
+            return queryset.none()
+        return self.filter_matches(queryset, terms)
+
+    def search(self, query):
+        return SearchResults(self, parse_terms(query))
+
+
+class LikeSearchBackend(SearchBackend):
+    """Поиск без индекса для баз без FTS: icontains по тексту записей
+    и комментариев. На SQLite регистр не учитывается только для латиницы.
+    """
+
+    def matching_posts(self, terms):
+        condition = Q()
+        for term in terms:
+            condition &= (
+                Q(text__icontains=term) | Q(comments__text__icontains=term)
+            )
+        return Post.objects.filter(condition).distinct()
+
+    def filter_matches(self, queryset, terms):
+        return queryset.filter(pk__in=self.matching_posts(terms).values('pk'))
+
+    def count(self, terms):
+        return self.matching_posts(terms).count()
+
+    def hits(self, terms, offset, limit):
+        post_ids = self.matching_posts(terms).order_by(
+            '-pub_date'
+        ).values_list('pk', flat=True)
+        stop = None if limit is None else offset + limit
+        post_ids = list(post_ids[offset:stop])
+        texts = dict(
+            Post.objects.filter(pk__in=post_ids).values_list('pk', 'text')
+        )
+        return [
+            (post_id, mark_terms(texts[post_id], terms), '')
+            for post_id in post_ids
+        ]
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """Инвертированный индекс на виртуальных таблицах SQLite FTS5.
+
+    Таблицы создаёт миграция; rowid в них совпадает с id записи
+    или комментария, так что обновление и удаление идут по ключу.
+    """
+
+    def execute(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def index_post(self, post):
+        self.remove_post(post.pk)
+        self.execute(
+            f'INSERT INTO {POST_TABLE} (rowid, text) VALUES (%s, %s)',
+            [post.pk, post.text]
+        )
+
+    def remove_post(self, post_id):
+        self.execute(f'DELETE FROM {POST_TABLE} WHERE rowid = %s', [post_id])
+
+    def index_comment(self, comment):
+        self.remove_comment(comment.pk)
+        self.execute(
+            f'INSERT INTO {COMMENT_TABLE} (rowid, post_id, text) '
+            'VALUES (%s, %s, %s)',
+            [comment.pk, comment.post_id, comment.text]
+        )
+
+    def remove_comment(self, comment_id):
+        self.execute(
+            f'DELETE FROM {COMMENT_TABLE} WHERE rowid = %s', [comment_id]
+        )
+
+    def rebuild(self):
+        self.execute(f'DELETE FROM {POST_TABLE}')
+        self.execute(f'DELETE FROM {COMMENT_TABLE}')
+        sources = (
+            (POST_TABLE, ('rowid', 'text'), Post.objects.values_list(
+                'pk', 'text'
+            )),
+            (COMMENT_TABLE, ('rowid', 'post_id', 'text'),
+             Comment.objects.values_list('pk', 'post_id', 'text')),
+        )
+        total = 0
+        for table, columns, rows in sources:
+            sql = (
+                f'INSERT INTO {table} ({", ".join(columns)}) '
+                f'VALUES ({", ".join(["%s"] * len(columns))})'
+            )
+            last_pk = 0
+            while True:
+                chunk = list(
+                    rows.filter(pk__gt=last_pk).order_by('pk')[:REINDEX_CHUNK]
+                )
+                if not chunk:
+                    break
+                with connection.cursor() as cursor:
+                    cursor.executemany(sql, chunk)
+                total += len(chunk)
+                last_pk = chunk[-1][0]
+        return total
+
+    def match(self, terms):
+        # Каждое слово в кавычках и с поиском по префиксу: синтаксис
+        # запросов FTS5 пользователю недоступен и не ломает запрос.
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def matches_sql(self):
+        return (
+            f'SELECT rowid AS post_id, bm25({POST_TABLE}) AS rank, '
+            f'highlight({POST_TABLE}, 0, %s, %s) AS text, '
+            'NULL AS comment '
+            f'FROM {POST_TABLE} WHERE {POST_TABLE} MATCH %s '
+            'UNION ALL '
+            f'SELECT post_id, bm25({COMMENT_TABLE}) * {COMMENT_WEIGHT}, '
+            'NULL, '
+            f'snippet({COMMENT_TABLE}, 1, %s, %s, %s, {SNIPPET_TOKENS}) '
+            f'FROM {COMMENT_TABLE} WHERE {COMMENT_TABLE} MATCH %s'
+        )
+
+    def matches_params(self, terms):
+        match = self.match(terms)
+        return [
+            MARK_START, MARK_END, match,
+            MARK_START, MARK_END, '…', match,
+        ]
+
+    def filter_matches(self, queryset, terms):
+        # RawSQL в pk__in Django берёт в лишние скобки, и UNION
+        # превращается в скалярный подзапрос с одной строкой.
+        column = '.'.join(
+            connection.ops.quote_name(name)
+            for name in (Post._meta.db_table, Post._meta.pk.column)
+        )
+        match = self.match(terms)
+        return queryset.extra(
+            where=[
+                f'{column} IN ('
+                f'SELECT rowid FROM {POST_TABLE} WHERE {POST_TABLE} MATCH %s '
+                'UNION '
+                f'SELECT post_id FROM {COMMENT_TABLE} '
+                f'WHERE {COMMENT_TABLE} MATCH %s)'
+            ],
+            params=[match, match]
+        )
+
+    def count(self, terms):
+        return self.execute(
+            'SELECT COUNT(DISTINCT post_id) '
+            f'FROM ({self.matches_sql()})',
+            self.matches_params(terms)
+        )[0][0]
+
+    def hits(self, terms, offset, limit):
+        return [
+            (post_id, text, comment)
+            for post_id, rank, text, comment in self.execute(
+                'SELECT post_id, MIN(rank) AS best, MAX(text), MAX(comment) '
+                f'FROM ({self.matches_sql()}) '
+                'GROUP BY post_id ORDER BY best, post_id DESC '
+                'LIMIT %s OFFSET %s',
+                self.matches_params(terms) + [
+                    -1 if limit is None else limit, offset
+                ]
+            )
+        ]
+
+
+@lru_cache(maxsize=None)
+def load_backend(path):
+    return import_string(path)()
+
+
+def get_search_backend():
+    return load_backend(settings.SEARCH_BACKEND)
@@ -0,0 +1,307 @@
+import io
+import random
+import time
+from collections import defaultdict
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+from yatube.settings import TIMELINE_BACKFILL, TIMELINE_FANOUT_LIMIT
+
+from .images import INGESTED_DIR, ingest_format
+from .models import Comment, Follow, Group, Post, TimelineEntry
+from .search import get_search_backend
+from .stats import recount_user_stats
+from .thumbnails import cut_card_thumbnails
+
+User = get_user_model()
+
+# Готовые объёмы синтетических данных
+SIZES = {
+    'tiny': {
+        'users': 50,
+        'groups': 3,
+        'posts': 300,
+        'comments': 600,
+        'follows': 300,
+    },
+    'small': {
+        'users': 200,
+        'groups': 5,
+        'posts': 2000,
+        'comments': 4000,
+        'follows': 2000,
+    },
+    'medium': {
+        'users': 5000,
+        'groups': 20,
+        'posts': 25000,
+        'comments': 50000,
+        'follows': 25000,
+    },
+    'large': {
+        'users': 20000,
+        'groups': 50,
+        'posts': 100000,
+        'comments': 200000,
+        'follows': 100000,
+    },
+    'huge': {
+        'users': 100000,
+        'groups': 200,
+        'posts': 2000000,
+        'comments': 4000000,
+        'follows': 2000000,
+    },
+}
+
+WORDS = (
+    'лев толстой писал длинные романы а чехов короткие рассказы '
+    'пушкин любил осень и болдино гоголь жил в риме и писал '
+    'о россии достоевский играл в рулетку и спешил со сроками'
+).split()
+
+CHUNK_SIZE = 10000
+SAMPLE_IMAGES = 8
+
+
+def make_text(rng, min_words=5, max_words=40):
+    words = rng.choices(WORDS, k=rng.randint(min_words, max_words))
+    return ' '.join(words).capitalize() + '.'
+
+
+def popularity_weights(count, exponent=1.0):
+    """Накопленные веса степенного закона: немногие получают почти всё.
+
+    При exponent=0 распределение равномерное.
+    """
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)
+    ))
+
+
+def chunked(items, size=CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def chunk_sizes(total, size=CHUNK_SIZE):
+    for start in range(0, total, size):
+        yield min(size, total - start)
+
+
+def seed_users(count, prefix):
+    password = make_password(None)
+    for start in range(0, count, CHUNK_SIZE):
+        User.objects.bulk_create([
+            User(username=f'{prefix}_{number}', password=password)
+            for number in range(start, min(start + CHUNK_SIZE, count))
+        ])
+    # SQLite не возвращает ключи из bulk_create, перечитываем их
+    return list(
+        User.objects.filter(username__startswith=f'{prefix}_')
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    )
+
+
+def seed_groups(count, prefix):
+    Group.objects.bulk_create([
+        Group(
+            title=f'Группа {number}',
+            slug=f'{prefix}-group-{number}',
+            description=f'Синтетическая группа {number}'
+        )
+        for number in range(count)
+    ])
+    return list(
+        Group.objects.filter(slug__startswith=f'{prefix}-group-')
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    )
+
+
+def seed_images(rng, count=SAMPLE_IMAGES):
+    """Несколько картинок-образцов, на которые ссылаются записи.
+
+    Образцы сразу сохраняются обработанными и с нарезанными
+    миниатюрами: записи из bulk_create сигналов не получают.
+    """
+    image_format, extension = ingest_format()
+    names = []
+    for number in range(count):
+        name = f'{INGESTED_DIR}seed/sample-{number}.{extension}'
+        if not default_storage.exists(name):
+            color = tuple(rng.randrange(256) for _ in range(3))
+            buffer = io.BytesIO()
+            Image.new('RGB', (1200, 800), color).save(buffer, image_format)
+            name = default_storage.save(name, ContentFile(buffer.getvalue()))
+        cut_card_thumbnails(name)
+        names.append(name)
+    return names
+
+
+def seed_posts(rng, count, author_ids, group_ids, options):
+    author_weights = popularity_weights(
+        len(author_ids), options['author_exponent']
+    )
+    group_weights = popularity_weights(
+        len(group_ids), options['group_exponent']
+    )
+    images = seed_images(rng) if options['image_ratio'] else []
+    last_pk = Post.objects.order_by('-pk').values_list('pk', flat=True)
+    last_pk = last_pk.first() or 0
+    for size in chunk_sizes(count):
+        authors = rng.choices(author_ids, cum_weights=author_weights, k=size)
+        posts = []
+        for author_id in authors:
+            post = Post(text=make_text(rng), author_id=author_id)
+            if group_ids and rng.random() < options['group_ratio']:
+                post.group_id = rng.choices(
+                    group_ids, cum_weights=group_weights
+                )[0]
+            if images and rng.random() < options['image_ratio']:
+                post.image = rng.choice(images)
+                post.image_ready = True
+            posts.append(post)
+        with transaction.atomic():
+            # Размер пачки Django подберёт сам под ограничения SQLite
+            Post.objects.bulk_create(posts)
+    return list(
+        Post.objects.filter(pk__gt=last_pk)
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    )
+
+
+def seed_comments(rng, count, post_ids, user_ids):
+    for size in chunk_sizes(count):
+        with transaction.atomic():
+            Comment.objects.bulk_create([
+                Comment(
+                    post_id=post_id,
+                    author_id=rng.choice(user_ids),
+                    text=make_text(rng, 3, 15)
+                )
+                for post_id in rng.choices(post_ids, k=size)
+            ])
+
+
+def seed_follows(rng, count, user_ids, exponent):
+    """Подписки без повторов; подписчиков у авторов по степенному закону."""
+    weights = popularity_weights(len(user_ids), exponent)
+    count = min(count, len(user_ids) * (len(user_ids) - 1))
+    pairs = set()
+    # Пар без повторов может не хватить при сильном перекосе
+    for _ in range(count * 3):
+        if len(pairs) >= count:
+            break
+        user_id = rng.choice(user_ids)
+        author_id = rng.choices(user_ids, cum_weights=weights)[0]
+        if user_id != author_id:
+            pairs.add((user_id, author_id))
+    pairs = sorted(pairs)
+    for chunk in chunked(pairs):
+        with transaction.atomic():
+            Follow.objects.bulk_create([
+                Follow(user_id=user, author_id=author)
+                for user, author in chunk
+            ])
+    return len(pairs)
+
+
+def seed_timelines(author_ids, chunk_size=1000):
+    """Раскладывает ленты так же, как сигналы при обычной подписке.
+
+    Авторы идут пачками, чтобы не держать в памяти все записи разом.
+    Возвращает число строк в лентах.
+    """
+    total = 0
+    for authors in chunked(author_ids, chunk_size):
+        followers = defaultdict(list)
+        for user_id, author_id in Follow.objects.filter(
+            author_id__in=authors
+        ).values_list('user_id', 'author_id'):
+            followers[author_id].append(user_id)
+        # Популярных авторов лента читает напрямую, им строки не нужны
+        followers = {
+            author_id: user_ids
+            for author_id, user_ids in followers.items()
+            if len(user_ids) <= TIMELINE_FANOUT_LIMIT
+        }
+        latest = defaultdict(list)
+        for pk, author_id, pub_date in Post.objects.filter(
+            author_id__in=list(followers)
+        ).order_by('-pub_date').values_list('pk', 'author_id', 'pub_date'):
+            if len(latest[author_id]) < TIMELINE_BACKFILL:
+                latest[author_id].append((pk, pub_date))
+        entries = []
+        for author_id, user_ids in followers.items():
+            for user_id in user_ids:
+                entries.extend(
+                    TimelineEntry(user_id=user_id, post_id=pk, pub_date=date)
+                    for pk, date in latest[author_id]
+                )
+            if len(entries) >= CHUNK_SIZE:
+                total += insert_timeline_entries(entries)
+                entries = []
+        total += insert_timeline_entries(entries)
+    return total
+
+
+def insert_timeline_entries(entries):
+    with transaction.atomic():
+        TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    return len(entries)
+
+
+def seed(users, groups, posts, comments, follows, seed=0, prefix='seed',
+         author_exponent=1.0, group_exponent=1.0, group_ratio=0.7,
+         follower_exponent=1.0, image_ratio=0.0, log=None):
+    """Наполняет базу синтетическими данными пачками по CHUNK_SIZE строк.
+
+    bulk_create обходит сигналы, поэтому ленты подписок, счётчики
+    пользователей и поисковый индекс строятся здесь же. Возвращает
+    число созданных строк.
+    """
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    started = time.monotonic()
+
+    def step(message):
+        log(f'{message} [{time.monotonic() - started:.1f} с]')
+
+    user_ids = seed_users(users, prefix)
+    group_ids = seed_groups(groups, prefix)
+    step(f'Пользователей: {len(user_ids)}, групп: {len(group_ids)}')
+    post_ids = seed_posts(rng, posts, user_ids, group_ids, {
+        'author_exponent': author_exponent,
+        'group_exponent': group_exponent,
+        'group_ratio': group_ratio,
+        'image_ratio': image_ratio,
+    })
+    step(f'Записей: {len(post_ids)}')
+    seed_comments(rng, comments, post_ids, user_ids)
+    step(f'Комментариев: {comments}')
+    follow_count = seed_follows(rng, follows, user_ids, follower_exponent)
+    step(f'Подписок: {follow_count}')
+    entries = seed_timelines(user_ids)
+    step(f'Строк в лентах: {entries}')
+    for batch in chunked(user_ids, 500):
+        recount_user_stats(User.objects.filter(pk__in=batch))
+    step('Счётчики пользователей пересчитаны')
+    indexed = get_search_backend().rebuild()
+    step(f'В поисковом индексе: {indexed}')
+    return {
+        'users': len(user_ids),
+        'groups': len(group_ids),
+        'posts': len(post_ids),
+        'comments': comments,
+        'follows': follow_count,
+        'timeline_entries': entries,
+    }
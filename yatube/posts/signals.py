@@ -0,0 +1,134 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .conditional import (
+    SITE, follower_scope, mark_changed, mark_post_changed
+)
+from .counters import (
+    author_scope, change_post_counts, group_scope, post_scopes
+)
+from .images import stage_upload
+from .models import Comment, Follow, Group, Post
+from .search import get_search_backend
+from .stats import change_user_stats
+from .thumbnails import schedule_thumbnails
+from .timelines import (
+    backfill_timeline, catch_up_author, fan_out_post, prune_timeline
+)
+
+
+@receiver(pre_save, sender=Post)
+def stage_uploaded_image(sender, instance, **kwargs):
+    stage_upload(instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_group(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+    previous = (
+        Post.objects.filter(pk=instance.pk)
+        .values('group_id', 'image', 'image_ready', 'card_version')
+        .first()
+    )
+    if previous is None:
+        return
+    instance._previous_group_id = previous['group_id']
+    instance._previous_image = previous['image']
+    # Готовность ведёт фоновая задача; устаревшую копию в памяти
+    # сохранять нельзя
+    if (previous['image'] or '') == (instance.image.name or ''):
+        instance.image_ready = previous['image_ready']
+    card_version = previous['card_version']
+    # Любая правка записи меняет её карточку в ленте
+    instance.card_version = card_version + 1
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    get_search_backend().index_post(instance)
+    if created:
+        image_changed = bool(instance.image) and not instance.image_ready
+    else:
+        previous_image = getattr(instance, '_previous_image', None) or ''
+        image_changed = previous_image != (instance.image.name or '')
+    # Из формы, админки или ORM — миниатюры нарежет фоновая задача
+    if image_changed:
+        schedule_thumbnails(instance)
+    mark_post_changed(instance.pk, instance.author_id, instance.group_id)
+    if created:
+        change_post_counts(
+            post_scopes(instance.author_id, instance.group_id), 1
+        )
+        change_user_stats(instance.author_id, posts=1)
+        fan_out_post(instance)
+        return
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    if previous_group_id == instance.group_id:
+        return
+    if previous_group_id is not None:
+        change_post_counts([group_scope(previous_group_id)], -1)
+        mark_changed(group_scope(previous_group_id))
+    if instance.group_id is not None:
+        change_post_counts([group_scope(instance.group_id)], 1)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    get_search_backend().remove_post(instance.pk)
+    mark_post_changed(instance.pk, instance.author_id, instance.group_id)
+    change_post_counts(post_scopes(instance.author_id, instance.group_id), -1)
+    change_user_stats(instance.author_id, posts=-1)
+
+
+def follow_created(user_id, author_id):
+    change_user_stats(author_id, followers=1)
+    change_user_stats(user_id, following=1)
+    backfill_timeline(user_id, author_id)
+    mark_changed(author_scope(author_id), follower_scope(user_id))
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        follow_created(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    change_user_stats(instance.author_id, followers=-1)
+    change_user_stats(instance.user_id, following=-1)
+    prune_timeline(instance.user_id, instance.author_id)
+    catch_up_author(instance.author_id)
+    mark_changed(
+        author_scope(instance.author_id), follower_scope(instance.user_id)
+    )
+
+
+def comment_changed(comment):
+    posts = Post.objects.filter(pk=comment.post_id)
+    posts.bump_card_version()
+    post = posts.values_list('author_id', 'group_id').first()
+    # При каскадном удалении записи её уже нет
+    if post is not None:
+        mark_post_changed(comment.post_id, *post)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, **kwargs):
+    get_search_backend().index_comment(instance)
+    comment_changed(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    get_search_backend().remove_comment(instance.pk)
+    comment_changed(instance)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    if not created:
+        instance.posts.bump_card_version()
+        # Название группы есть на карточках во всех лентах
+        mark_changed(SITE)
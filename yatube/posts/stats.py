@@ -0,0 +1,70 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Follow, Post, UserStats
+
+User = get_user_model()
+
+
+def count_by(model, field):
+    counts = (
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def recount_user_stats(users, batch_size=500, replace=True):
+    """Пересчитывает счётчики для набора пользователей с нуля.
+
+    replace=False только досоздаёт недостающие строки: так дешевле
+    ленивое чтение, когда строк заведомо нет.
+    """
+    rows = users.annotate(
+        followers_count=count_by(Follow, 'author'),
+        following_count=count_by(Follow, 'user'),
+        posts_count=count_by(Post, 'author'),
+    ).values_list(
+        'pk', 'followers_count', 'following_count', 'posts_count'
+    )
+    stats = [
+        UserStats(
+            user_id=pk,
+            followers=followers,
+            following=following,
+            posts=posts
+        )
+        for pk, followers, following, posts in rows
+    ]
+    if not replace:
+        UserStats.objects.bulk_create(
+            stats, batch_size=batch_size, ignore_conflicts=True
+        )
+        return stats
+    with transaction.atomic():
+        UserStats.objects.filter(
+            user_id__in=[item.user_id for item in stats]
+        ).delete()
+        UserStats.objects.bulk_create(stats, batch_size=batch_size)
+    return stats
+
+
+def get_user_stats(user_id):
+    try:
+        return UserStats.objects.get(user_id=user_id)
+    except UserStats.DoesNotExist:
+        return recount_user_stats(
+            User.objects.filter(pk=user_id), replace=False
+        )[0]
+
+
+def change_user_stats(user_id, **deltas):
+    """Сдвигает счётчики; отсутствующую строку посчитает первое чтение."""
+    UserStats.objects.filter(user_id=user_id).update(**{
+        name: F(name) + delta for name, delta in deltas.items()
+    })
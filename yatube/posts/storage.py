@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils._os import safe_join
+
+# Загрузки, ждущие обработки
+STAGED_DIR = 'staged/'
+
+
+def is_staged(name):
+    return (name or '').startswith(STAGED_DIR)
+
+
+class MediaStorage(FileSystemStorage):
+    """Медиафайлы; отложенные загрузки лежат в UPLOAD_STAGING_ROOT.
+
+    Запись ссылается на необработанную загрузку как на обычный файл,
+    но та лежит вне MEDIA_ROOT и по ссылке /media/ недоступна.
+    """
+
+    def path(self, name):
+        if is_staged(name):
+            return safe_join(settings.UPLOAD_STAGING_ROOT, name)
+        return super().path(name)
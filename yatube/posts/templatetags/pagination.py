@@ -0,0 +1,23 @@
+from django import template
+
+from yatube.settings import POSTS_PAGINATOR_WINDOW
+
+register = template.Library()
+
+
+@register.filter
+def page_window(page, size=POSTS_PAGINATOR_WINDOW):
+    """Номера страниц вокруг текущей, None на месте пропуска."""
+    last = page.paginator.num_pages
+    start = max(page.number - size, 1)
+    end = min(page.number + size, last)
+    window = list(range(start, end + 1))
+    if start > 2:
+        window.insert(0, None)
+    if start > 1:
+        window.insert(0, 1)
+    if end < last - 1:
+        window.append(None)
+    if end < last:
+        window.append(last)
+    return window
@@ -0,0 +1,124 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.database import get_latency_metrics, reset_latency_metrics
+from core.testing import run_on_commit
+
+from posts.benchmarks import compare, percentile, sqlite_concurrency
+from posts.caching import get_version
+from posts.conditional import SITE, version_key
+from posts.models import Follow, Post, TimelineEntry, UserStats
+from posts.search import get_search_backend
+from posts.seeding import seed
+
+
+class SeedingTest(TestCase):
+    def test_seed_builds_timelines_and_stats(self):
+        summary = seed(
+            users=30, groups=2, posts=200, comments=100, follows=60, seed=1
+        )
+        self.assertEqual(Post.objects.count(), summary['posts'])
+        self.assertEqual(Follow.objects.count(), summary['follows'])
+        follow = Follow.objects.first()
+        self.assertEqual(
+            TimelineEntry.objects.filter(
+                user=follow.user, post__author=follow.author
+            ).count(),
+            follow.author.posts.count()
+        )
+        stats = UserStats.objects.get(user=follow.author)
+        self.assertEqual(stats.followers, follow.author.following.count())
+        self.assertEqual(stats.posts, follow.author.posts.count())
+        word = Post.objects.first().text.split()[0]
+        self.assertGreater(get_search_backend().search(word).count(), 0)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR))
+    def test_seed_yatube_command(self):
+        self.addCleanup(
+            shutil.rmtree, settings.MEDIA_ROOT, ignore_errors=True
+        )
+        site_version = get_version(version_key(SITE))
+        with run_on_commit():
+            call_command(
+                'seed_yatube', size='tiny', posts=100, image_ratio=0.5,
+                group_ratio=1, stdout=StringIO()
+            )
+        self.assertEqual(Post.objects.count(), 100)
+        self.assertFalse(Post.objects.filter(group=None).exists())
+        self.assertTrue(Post.objects.exclude(image='').exists())
+        # Образцы уже обработаны, фоновая нарезка им не нужна
+        self.assertFalse(
+            Post.objects.exclude(image='').filter(image_ready=False).exists()
+        )
+        self.assertNotEqual(get_version(version_key(SITE)), site_version)
+        with self.assertRaises(CommandError):
+            call_command('seed_yatube', size='tiny', stdout=StringIO())
+
+
+class BenchmarkReportTest(TestCase):
+    def test_percentile_uses_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+
+    def test_compare_flags_slower_pages_and_extra_queries(self):
+        baseline = {
+            'index': {'p95_ms': 10, 'queries': 4},
+            'profile': {'p95_ms': 10, 'queries': 7},
+            'post_view': {'p95_ms': 10, 'queries': 7},
+        }
+        results = {
+            'index': {'p95_ms': 10.5, 'queries': 4},
+            'profile': {'p95_ms': 20, 'queries': 7},
+            'post_view': {'p95_ms': 9, 'queries': 8},
+        }
+        lines, regressions = compare(baseline, results, threshold=10)
+        self.assertEqual(regressions, ['profile', 'post_view'])
+        self.assertEqual(len(lines), 3)
+
+
+class DatabaseTuningTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_latency_metrics()
+
+    def test_pragmas_are_applied_on_connect(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(
+                cursor.fetchone()[0], settings.SQLITE_PRAGMAS['cache_size']
+            )
+            cursor.execute('PRAGMA synchronous')
+            # NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_requests_feed_latency_metrics(self):
+        self.client.get(reverse('index'))
+        metrics = get_latency_metrics()
+        self.assertGreater(metrics['read']['count'], 0)
+        self.assertEqual(
+            sum(metrics['read']['buckets'].values()),
+            metrics['read']['count']
+        )
+        output = StringIO()
+        call_command('db_stats', reset=True, stdout=output)
+        self.assertIn('read: запросов', output.getvalue())
+        self.assertEqual(get_latency_metrics()['read']['count'], 0)
+
+    def test_wal_readers_survive_concurrent_writes(self):
+        result = sqlite_concurrency(
+            settings.SQLITE_PRAGMAS, duration=0.3, readers=2, rows=100
+        )
+        self.assertEqual(result['read_errors'], 0)
+        self.assertGreater(result['reads'], 0)
+        self.assertGreater(result['rows_written'], 0)
@@ -1,5 +1,9 @@
+from unittest import skipUnless
+
 from posts.models import Post, Group, Comment, Follow
+from posts.timelines import timeline_posts
 
+from django.db import IntegrityError, connection
 from django.test import TestCase, Client
 
 from django.contrib.auth import get_user_model
@@ -78,3 +82,43 @@ class FollowModelTest(TestCase):
         follow = self.follow
         expected_object_name = str(self.user)
         self.assertEquals(expected_object_name, str(follow))
+
+    def test_duplicate_follow_is_rejected(self):
+        with self.assertRaises(IntegrityError):
+            Follow.objects.create(user=self.user, author=self.user1)
+
+
+class FeedIndexTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='TestUser')
+        cls.author = User.objects.create_user(username='TestUser1')
+
+    def assertUsesIndex(self, queryset, index_name=''):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index_name}'.strip(), plan.replace(
+            'USING COVERING INDEX', 'USING INDEX'
+        ))
+        self.assertNotIn('TEMP B-TREE FOR ORDER BY', plan)
+
+    @skipUnless(connection.vendor == 'sqlite', 'Планы разбираются для SQLite')
+    def test_feed_queries_use_indexes(self):
+        feeds = {
+            'post_author_pub_date_idx': Post.objects.for_feed().filter(
+                author=self.author
+            ),
+            'post_group_pub_date_idx': Post.objects.for_feed().filter(
+                group_id=1
+            ),
+            'comment_post_created_idx': Comment.objects.filter(post_id=1),
+            'timeline_user_pub_date_idx': timeline_posts(self.user),
+        }
+        for index_name, queryset in feeds.items():
+            with self.subTest(index_name=index_name):
+                self.assertUsesIndex(queryset, index_name)
+
+    @skipUnless(connection.vendor == 'sqlite', 'Планы разбираются для SQLite')
+    def test_follow_lookup_uses_index(self):
+        self.assertUsesIndex(
+            self.author.following.filter(user=self.user.id)
+        )
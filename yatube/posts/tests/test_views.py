@@ -1,15 +1,45 @@
+import json
+import os
+import re
 import shutil
 import tempfile
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from http import HTTPStatus
+from io import BytesIO, StringIO
+from unittest import mock
+from xml.etree import ElementTree
 
 from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.management import call_command
 from django.conf import settings
-from django.test import TestCase, Client
+from django.db import connection
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.paginator import Paginator
 from django import forms
+from PIL import Image
+from sorl.thumbnail.models import KVStore
 
-from posts.models import Group, Post, Follow
+from core.testing import QueryBudgetMixin, run_on_commit
+from posts import feeds, search, thumbnails, writebehind
+from posts.caching import INDEX_VERSION_KEY, get_cache_metrics
+from posts.counters import author_scope, get_post_count
+from posts.images import INGESTED_DIR, ingest_format, sweep_staged
+from posts.kvstore import PersistentFileCache
+from posts.models import (
+    Group, Post, Follow, Comment, TimelineEntry, UserStats
+)
+from posts.stats import get_user_stats, recount_user_stats
+from posts.storage import STAGED_DIR
+from posts.thumbnails import generate_thumbnails
+from posts.templatetags.pagination import page_window
 
 User = get_user_model()
 
@@ -237,6 +267,20 @@ class PostsPagesTests(TestCase):
         page_post_3 = response_3.context['page'][0]
         self.assertNotEqual(page_post_1, page_post_3)
 
+    def test_new_post_invalidates_index_cache(self):
+        self.authorized_client.get(reverse('index'))
+        with run_on_commit():
+            self.authorized_client.post(
+                reverse('new_post'), data={'text': 'Свежая запись'}
+            )
+            # До коммита главная остаётся прежней
+            response = self.authorized_client.get(reverse('index'))
+            self.assertEqual(
+                response.context['page'][0].text, 'Тестовая запись'
+            )
+        response = self.authorized_client.get(reverse('index'))
+        self.assertEqual(response.context['page'][0].text, 'Свежая запись')
+
     def test_authorized_user_can_follow(self):
         self.authorized_client.get(reverse(
             'profile_follow',
@@ -330,3 +374,1098 @@ class PaginatorViewsTest(TestCase):
     def test_second_page_containse_three_records(self):
         response = self.authorized_client.get(reverse('index') + '?page=2')
         self.assertEqual(len(response.context.get('page').object_list), 3)
+
+    def test_cursor_pages_walk_the_feed(self):
+        url = reverse('index')
+        first_page = self.authorized_client.get(url + '?after=')
+        first_page = first_page.context['page']
+        self.assertEqual(len(first_page), 10)
+        self.assertTrue(first_page.has_next())
+        self.assertFalse(first_page.has_previous())
+        second_page = self.authorized_client.get(
+            url + '?after=' + first_page.next_cursor()
+        ).context['page']
+        self.assertEqual(len(second_page), 3)
+        self.assertFalse(second_page.has_next())
+        back_page = self.authorized_client.get(
+            url + '?before=' + second_page.previous_cursor()
+        ).context['page']
+        self.assertEqual(
+            list(back_page.object_list),
+            list(first_page.object_list)
+        )
+
+
+class FeedQueriesTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='writer')
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.user)
+        cls.group = Group.objects.create(
+            title='Заголовок',
+            description='Текст',
+            slug='test-slug',
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        for i in range(settings.POSTS_PAGINATOR_COUNT * 2):
+            post = Post.objects.create(
+                text='Тестовая запись',
+                author=cls.author,
+                group=cls.group
+            )
+            Comment.objects.create(post=post, author=cls.user, text='Ок')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_feed_pages_query_budget(self):
+        """Число запросов ленты не зависит от количества записей."""
+        feed_urls = [
+            reverse('index'),
+            reverse('group_posts', kwargs={'slug': 'test-slug'}),
+            reverse('profile', kwargs={'username': 'writer'}),
+            reverse('follow_index'),
+        ]
+        for url in feed_urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertWithinQueryBudget(response)
+                self.assertEqual(
+                    len(response.context['page']),
+                    settings.POSTS_PAGINATOR_COUNT
+                )
+                self.assertEqual(response.context['page'][0].comment_count, 1)
+
+    def test_post_page_query_budget(self):
+        post = Post.objects.filter(author=self.author).first()
+        response = self.authorized_client.get(reverse(
+            'post_view',
+            kwargs={'username': 'writer', 'post_id': post.pk}
+        ))
+        self.assertWithinQueryBudget(response)
+
+    def test_profiler_reports_queries_in_debug_headers(self):
+        with override_settings(DEBUG=True):
+            response = self.authorized_client.get(reverse('index'))
+        self.assertEqual(
+            int(response['X-Query-Count']), response.query_profile.count
+        )
+        self.assertEqual(response['X-Query-Duplicates'], '0')
+
+    @override_settings(QUERY_BUDGETS={'index': 1})
+    def test_profiler_logs_exceeded_budget(self):
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            self.authorized_client.get(reverse('index'))
+        self.assertIn('бюджет 1', logs.output[0])
+
+    def test_cached_index_page_skips_post_queries(self):
+        self.authorized_client.get(reverse('index') + '?page=2')
+        with self.assertNumQueries(2):
+            response = self.authorized_client.get(reverse('index') + '?page=2')
+        self.assertEqual(response.context['page'].number, 2)
+        self.assertEqual(
+            response.context['page'].paginator.count,
+            settings.POSTS_PAGINATOR_COUNT * 2
+        )
+
+    def test_feed_counters_follow_created_and_deleted_posts(self):
+        url = reverse('profile', kwargs={'username': 'writer'})
+        self.authorized_client.get(url)
+        post = Post.objects.create(text='Ещё запись', author=self.author)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                get_post_count(author_scope(self.author.pk), None),
+                settings.POSTS_PAGINATOR_COUNT * 2 + 1
+            )
+        post.delete()
+        response = self.authorized_client.get(url)
+        self.assertEqual(
+            response.context['page'].paginator.count,
+            settings.POSTS_PAGINATOR_COUNT * 2
+        )
+
+    def test_page_window_elides_distant_pages(self):
+        paginator = Paginator(range(100), 1)
+        self.assertEqual(
+            page_window(paginator.page(50), 2),
+            [1, None, 48, 49, 50, 51, 52, None, 100]
+        )
+        self.assertEqual(
+            page_window(paginator.page(2), 2),
+            [1, 2, 3, 4, None, 100]
+        )
+
+
+class SharedCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(text='Первая запись', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cache_stats_report_index_hits_and_misses(self):
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        out = StringIO()
+        call_command('cache_stats', reset=True, stdout=out)
+        self.assertIn('index_page: попаданий 1, промахов 1', out.getvalue())
+        self.assertEqual(get_cache_metrics()['index_page'], (0, 0))
+
+    @override_settings(CACHE_TTLS={'index': 0})
+    def test_index_ttl_comes_from_settings(self):
+        self.client.get(reverse('index'))
+        Post.objects.create(text='Новая запись', author=self.user)
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['page'][0].text, 'Новая запись')
+
+    def test_workers_share_index_invalidation(self):
+        location = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        params = {'LOCATION': location, 'KEY_PREFIX': 'yatube'}
+        shared = {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            **params
+        }
+        with override_settings(CACHES={'default': shared}):
+            self.client.get(reverse('index'))
+            Post.objects.create(text='Новая запись', author=self.user)
+            response = self.client.get(reverse('index'))
+            self.assertEqual(response.context['page'][0], self.post)
+            # Другой воркер со своим экземпляром бэкенда
+            other_worker = FileBasedCache(location, params)
+            other_worker.incr(INDEX_VERSION_KEY)
+            response = self.client.get(reverse('index'))
+            self.assertEqual(
+                response.context['page'][0].text, 'Новая запись'
+            )
+
+
+class SearchTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'
+        )
+        cls.title_post = Post.objects.create(
+            text='Заметки о Толстом и <b>его</b> романах', author=cls.user
+        )
+        cls.comment_post = Post.objects.create(
+            text='Просто запись', author=cls.user
+        )
+        Comment.objects.create(
+            post=cls.comment_post, author=cls.user, text='А я читал Толстого'
+        )
+        Post.objects.create(text='Про Чехова', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query, **params):
+        return self.client.get(reverse('search'), {'q': query, **params})
+
+    def test_search_ranks_posts_over_comments(self):
+        response = self.search('толст')
+        self.assertWithinQueryBudget(response)
+        page = response.context['page']
+        self.assertEqual(
+            list(page), [self.title_post, self.comment_post]
+        )
+        self.assertEqual(page[1].search_comment.count('<mark>'), 1)
+
+    def test_search_highlights_and_escapes_text(self):
+        response = self.search('толстом')
+        self.assertContains(response, '<mark>Толстом</mark>')
+        self.assertContains(response, '&lt;b&gt;его&lt;/b&gt;')
+
+    def test_search_index_follows_edits_and_deletes(self):
+        post = Post.objects.create(text='Гоголь', author=self.user)
+        self.assertEqual(list(self.search('гоголь').context['page']), [post])
+        post.text = 'Пушкин'
+        post.save()
+        self.assertEqual(len(self.search('гоголь').context['page']), 0)
+        post.delete()
+        self.assertEqual(len(self.search('пушкин').context['page']), 0)
+        self.comment_post.comments.all().delete()
+        self.assertEqual(
+            list(self.search('толстого').context['page']), []
+        )
+
+    def test_search_paginates_and_keeps_query(self):
+        for _ in range(settings.POSTS_PAGINATOR_COUNT):
+            Post.objects.create(text='Чехов снова', author=self.user)
+        response = self.search('чехов', page=2)
+        self.assertEqual(response.context['page'].paginator.count, 11)
+        self.assertEqual(len(response.context['page']), 1)
+        self.assertContains(response, '?q=%D1%87%D0%B5%D1%85%D0%BE%D0%B2&')
+
+    def test_empty_and_special_queries_return_nothing(self):
+        for query in ('', '"*()', 'NOT'):
+            with self.subTest(query=query):
+                response = self.search(query)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.context['page']), 0)
+
+    def test_reindex_rebuilds_from_tables(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.POST_TABLE}')
+        self.assertEqual(len(self.search('чехов').context['page']), 0)
+        out = StringIO()
+        call_command('reindex_search', stdout=out)
+        self.assertIn('4', out.getvalue())
+        self.assertEqual(len(self.search('чехов').context['page']), 1)
+
+    @override_settings(SEARCH_BACKEND='posts.search.LikeSearchBackend')
+    def test_like_backend_is_pluggable(self):
+        response = self.search('читал')
+        self.assertEqual(list(response.context['page']), [self.comment_post])
+
+    def test_admin_search_uses_index(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'чехов'}
+        )
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+    def test_filter_posts_keeps_matches_in_the_query(self):
+        # LIKE в SQLite не сравнивает кириллицу без учёта регистра
+        cases = (
+            (search.SQLiteFTSBackend(), 'толст'),
+            (search.LikeSearchBackend(), 'олст'),
+        )
+        for backend, query in cases:
+            with self.subTest(backend=type(backend).__name__):
+                posts = backend.filter_posts(Post.objects.all(), query)
+                with self.assertNumQueries(1):
+                    self.assertEqual(
+                        set(posts), {self.title_post, self.comment_post}
+                    )
+                self.assertFalse(
+                    backend.filter_posts(Post.objects.all(), '"*').exists()
+                )
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='writer')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Классики', slug='classics', description='Текст'
+        )
+        cls.post = Post.objects.create(
+            text='Первая версия', author=cls.author, group=cls.group
+        )
+        cls.url = reverse('profile', kwargs={'username': 'writer'})
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def card_key(self):
+        post = Post.objects.get(pk=self.post.pk)
+        # Профиль показывает карточки в узкой колонке
+        return make_template_fragment_key(
+            'post_card', [post.pk, post.card_version, 'column']
+        )
+
+    def test_card_is_cached_and_edit_button_stays_per_viewer(self):
+        self.reader_client.get(self.url)
+        self.assertIsNotNone(cache.get(self.card_key()))
+        edit_button = 'Редактировать'
+        self.assertNotContains(self.reader_client.get(self.url), edit_button)
+        self.assertContains(self.author_client.get(self.url), edit_button)
+
+    def edit_post(self):
+        self.author_client.post(
+            reverse('post_edit', kwargs={
+                'username': 'writer', 'post_id': self.post.pk
+            }),
+            data={'text': 'Вторая версия', 'group': self.group.pk}
+        )
+
+    def add_comment(self):
+        Comment.objects.create(post=self.post, author=self.reader, text='Ок')
+
+    def rename_group(self):
+        self.group.title = 'Русские классики'
+        self.group.save()
+
+    def test_edit_comment_and_group_change_bump_card_version(self):
+        self.reader_client.get(self.url)
+        changes = (
+            (self.edit_post, 'Вторая версия'),
+            (self.add_comment, 'Комментариев: 1'),
+            (self.rename_group, '#Русские классики'),
+        )
+        for change, expected in changes:
+            with self.subTest(expected=expected):
+                old_key = self.card_key()
+                change()
+                self.assertNotEqual(self.card_key(), old_key)
+                self.assertContains(self.reader_client.get(self.url), expected)
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='writer')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Классики', slug='classics', description='Текст'
+        )
+        cls.post = Post.objects.create(
+            text='Запись', author=cls.author, group=cls.group
+        )
+        cls.urls = {
+            'index': reverse('index'),
+            'group': reverse('group_posts', kwargs={'slug': 'classics'}),
+            'profile': reverse('profile', kwargs={'username': 'writer'}),
+            'post': reverse('post_view', kwargs={
+                'username': 'writer', 'post_id': cls.post.pk
+            }),
+        }
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def revalidate(self, url):
+        etag = self.client.get(url)['ETag']
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_pages_return_not_modified(self):
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                response = self.revalidate(url)
+                self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+                self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_changes_in_scope_invalidate_etag(self):
+        changes = {
+            'group': lambda: Post.objects.create(
+                text='Ещё', author=self.reader, group=self.group
+            ),
+            'post': lambda: Comment.objects.create(
+                post=self.post, author=self.reader, text='Ок'
+            ),
+            'profile': lambda: Follow.objects.create(
+                user=self.reader, author=self.author
+            ),
+        }
+        for name, change in changes.items():
+            with self.subTest(page=name):
+                url = self.urls[name]
+                etag = self.client.get(url)['ETag']
+                with run_on_commit():
+                    change()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_versions_change_only_after_commit(self):
+        url = self.urls['group']
+        etag = self.client.get(url)['ETag']
+        with run_on_commit():
+            Post.objects.create(
+                text='Ещё', author=self.reader, group=self.group
+            )
+            self.assertEqual(self.client.get(url)['ETag'], etag)
+        self.assertNotEqual(self.client.get(url)['ETag'], etag)
+
+    def test_etag_depends_on_viewer(self):
+        url = self.urls['profile']
+        etag = self.client.get(url)['ETag']
+        response = Client().get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_missing_objects_still_return_not_found(self):
+        response = self.client.get(
+            reverse('group_posts', kwargs={'slug': 'missing'})
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class FeedEndpointsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='writer')
+        cls.group = Group.objects.create(
+            title='Классики', slug='classics', description='Текст'
+        )
+        Post.objects.create(text='Без группы', author=cls.author)
+        cls.post = Post.objects.create(
+            text='Про <Толстого> & Ко', author=cls.author, group=cls.group
+        )
+        cls.feeds = [
+            reverse('index_feed', args=[feed_format])
+            for feed_format in ('atom', 'json')
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def read(self, response):
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        if response.streaming:
+            return b''.join(response.streaming_content)
+        return response.content
+
+    def test_atom_feed_is_streamed_and_valid(self):
+        response = self.client.get(reverse('index_feed', args=['atom']))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], feeds.ATOM_CONTENT_TYPE)
+        root = ElementTree.fromstring(self.read(response))
+        namespace = '{http://www.w3.org/2005/Atom}'
+        entries = root.findall(f'{namespace}entry')
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(
+            entries[0].find(f'{namespace}content').text, self.post.text
+        )
+
+    def test_json_feed_lists_scope_posts(self):
+        urls = {
+            reverse('index_feed', args=['json']): 2,
+            reverse('group_feed', args=['classics', 'json']): 1,
+            reverse('profile_feed', args=['writer', 'json']): 2,
+        }
+        for url, count in urls.items():
+            with self.subTest(url=url):
+                feed = json.loads(self.read(self.client.get(url)))
+                self.assertEqual(feed['version'], feeds.JSON_FEED_VERSION)
+                self.assertEqual(len(feed['items']), count)
+                self.assertEqual(
+                    feed['items'][0]['content_text'], self.post.text
+                )
+
+    @override_settings(FEED_MAX_ITEMS=1)
+    def test_feed_is_limited_and_served_from_cache(self):
+        url = reverse('index_feed', args=['json'])
+        body = self.read(self.client.get(url))
+        self.assertEqual(len(json.loads(body)['items']), 1)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.content, body)
+
+    def test_feed_answers_conditional_get(self):
+        url = reverse('group_feed', args=['classics', 'atom'])
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        with run_on_commit():
+            Post.objects.create(
+                text='Новая', author=self.author, group=self.group
+            )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(len(ElementTree.fromstring(
+            self.read(response)
+        ).findall('{http://www.w3.org/2005/Atom}entry')), 2)
+
+    def test_missing_group_feed_returns_not_found(self):
+        response = self.client.get(
+            reverse('group_feed', args=['missing', 'atom'])
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class CommentPaginationTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='writer')
+        cls.post = Post.objects.create(text='Обсуждаемая', author=cls.author)
+        Comment.objects.bulk_create([
+            Comment(post=cls.post, author=cls.author, text=f'Ответ {number}')
+            for number in range(settings.COMMENTS_PAGE_SIZE * 2 + 5)
+        ])
+        cls.expected = list(cls.post.comments.order_by(
+            '-created', '-pk'
+        ).values_list('pk', flat=True))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_post_page_renders_first_portion(self):
+        response = self.client.get(reverse(
+            'post_view', args=['writer', self.post.pk]
+        ))
+        self.assertWithinQueryBudget(response)
+        comments = response.context['comments']
+        self.assertEqual(
+            [comment.pk for comment in comments],
+            self.expected[:settings.COMMENTS_PAGE_SIZE]
+        )
+        self.assertContains(response, 'comments-more')
+
+    def test_more_comments_are_loaded_by_cursor(self):
+        page = self.client.get(reverse(
+            'post_view', args=['writer', self.post.pk]
+        )).context['comments']
+        url = reverse('post_comments', args=['writer', self.post.pk])
+        loaded = [comment.pk for comment in page]
+        cursor = page.next_cursor()
+        while cursor:
+            response = self.client.get(url, {'after': cursor})
+            self.assertWithinQueryBudget(response)
+            data = response.json()
+            loaded += [
+                int(pk) for pk in re.findall(r'name="comment_(\d+)"',
+                                             data['html'])
+            ]
+            cursor = data['next']
+        self.assertEqual(loaded, self.expected)
+
+    def test_unknown_post_comments_return_not_found(self):
+        response = self.client.get(
+            reverse('post_comments', args=['nobody', self.post.pk])
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='writer')
+        cls.old_post = Post.objects.create(
+            text='Старая запись',
+            author=cls.author
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def follow(self):
+        self.authorized_client.get(reverse(
+            'profile_follow',
+            kwargs={'username': self.author.username}
+        ))
+
+    def test_follow_backfills_and_unfollow_prunes_timeline(self):
+        self.follow()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user,
+            post=self.old_post
+        ).exists())
+        self.authorized_client.get(reverse(
+            'profile_unfollow',
+            kwargs={'username': self.author.username}
+        ))
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user).exists())
+
+    def test_new_post_fans_out_to_followers(self):
+        self.follow()
+        self.author_client.post(reverse('new_post'), data={'text': 'Новая'})
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user).first().post.text,
+            'Новая'
+        )
+
+    def test_heavy_author_posts_are_read_on_demand(self):
+        with mock.patch('posts.timelines.TIMELINE_FANOUT_LIMIT', 0):
+            self.follow()
+            self.author_client.post(
+                reverse('new_post'),
+                data={'text': 'Новая'}
+            )
+            self.assertFalse(
+                TimelineEntry.objects.filter(user=self.user).exists()
+            )
+            response = self.authorized_client.get(reverse('follow_index'))
+        self.assertEqual(len(response.context['page']), 2)
+
+    def test_feed_pages_past_backfill(self):
+        self.long_history()
+        with mock.patch('posts.timelines.TIMELINE_BACKFILL', 5):
+            self.follow()
+            self.assertEqual(
+                TimelineEntry.objects.filter(user=self.user).count(), 5
+            )
+            response = self.authorized_client.get(
+                reverse('follow_index'), {'page': 4}
+            )
+        self.assertEqual(response.context['paginator'].count, 31)
+        self.assertEqual(len(response.context['page']), 1)
+        self.assertEqual(response.context['page'][0], self.old_post)
+
+    def long_history(self):
+        Post.objects.bulk_create([
+            Post(text=f'Запись {number}', author=self.author)
+            for number in range(30)
+        ])
+        # bulk_create не шлёт сигналов: счётчики пересчитываем, как сидер
+        recount_user_stats(User.objects.filter(pk=self.author.pk))
+
+    def test_feed_cursor_walks_past_backfill(self):
+        self.long_history()
+        with mock.patch('posts.timelines.TIMELINE_BACKFILL', 5):
+            self.follow()
+        seen = []
+        params = {'after': ''}
+        while True:
+            page = self.authorized_client.get(
+                reverse('follow_index'), params
+            ).context['page']
+            seen += [post.pk for post in page]
+            if not page.has_next():
+                break
+            params = {'after': page.next_cursor()}
+        self.assertEqual(
+            seen,
+            list(Post.objects.order_by('-pub_date', '-pk').values_list(
+                'pk', flat=True
+            ))
+        )
+
+    def test_author_dropping_below_limit_is_fanned_out(self):
+        other = User.objects.create_user(username='other')
+        with mock.patch('posts.timelines.TIMELINE_FANOUT_LIMIT', 1):
+            self.follow()
+            Follow.objects.create(user=other, author=self.author)
+            post = Post.objects.create(text='Популярная', author=self.author)
+            self.assertFalse(
+                TimelineEntry.objects.filter(post=post).exists()
+            )
+            Follow.objects.filter(user=other).delete()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user, post=post
+        ).exists())
+
+
+class WriteBehindTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.queue_dir = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        cls.queue_settings = override_settings(
+            WRITE_BEHIND=True,
+            WRITE_BEHIND_QUEUE=os.path.join(cls.queue_dir, 'queue.sqlite3')
+        )
+        cls.queue_settings.enable()
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='writer')
+        cls.post = Post.objects.create(text='Запись', author=cls.author)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.queue_settings.disable()
+        shutil.rmtree(cls.queue_dir, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+        self.addCleanup(self.clear_queue)
+
+    def clear_queue(self):
+        connection = writebehind.connect()
+        connection.execute('DELETE FROM queue')
+        connection.close()
+
+    def post_url(self):
+        return reverse('post_view', args=['writer', self.post.pk])
+
+    def test_comment_is_shown_to_its_author_until_flushed(self):
+        etag = self.client.get(self.post_url())['ETag']
+        with run_on_commit():
+            self.client.post(
+                reverse('add_comment', args=['writer', self.post.pk]),
+                {'text': 'отложенный ответ'}
+            )
+        self.assertFalse(Comment.objects.exists())
+        response = self.client.get(self.post_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'ожидает публикации')
+        self.assertNotContains(Client().get(self.post_url()), 'отложенный')
+        self.assertEqual(writebehind.flush(), 1)
+        comment = Comment.objects.get()
+        self.assertEqual(comment.author, self.reader)
+        self.assertQuerysetEqual(
+            search.get_search_backend().filter_posts(
+                Post.objects.all(), 'отложенный'
+            ),
+            [self.post.pk],
+            transform=lambda post: post.pk
+        )
+        self.assertEqual(writebehind.flush(), 0)
+        self.assertNotContains(
+            self.client.get(self.post_url()), 'ожидает публикации'
+        )
+
+    def queued_jobs(self):
+        connection = writebehind.connect()
+        try:
+            return [
+                writebehind.Job(*row) for row in connection.execute(
+                    f'SELECT {", ".join(writebehind.Job._fields)} FROM queue'
+                )
+            ]
+        finally:
+            connection.close()
+
+    def test_replayed_comment_is_not_duplicated(self):
+        writebehind.enqueue(
+            writebehind.COMMENT, self.reader.pk, self.post.pk, 'повтор'
+        )
+        jobs = self.queued_jobs()
+        # Воркер упал после записи, но до удаления пачки из очереди
+        writebehind.apply_comments(jobs)
+        self.assertEqual(writebehind.apply_comments(jobs), [])
+        writebehind.flush()
+        self.assertEqual(Comment.objects.count(), 1)
+
+    def test_repeated_comments_are_all_written(self):
+        for _ in range(2):
+            writebehind.enqueue(
+                writebehind.COMMENT, self.reader.pk, self.post.pk, 'ещё'
+            )
+        writebehind.flush()
+        self.assertEqual(Comment.objects.filter(text='ещё').count(), 2)
+
+    def test_comment_is_dated_by_its_job(self):
+        with mock.patch.object(writebehind.time, 'time', return_value=1e9):
+            writebehind.enqueue(
+                writebehind.COMMENT, self.reader.pk, self.post.pk, 'давний'
+            )
+        writebehind.flush()
+        self.assertEqual(
+            Comment.objects.get().created,
+            datetime.fromtimestamp(1e9, tz=timezone.utc)
+        )
+
+    def test_follow_written_around_queue_is_counted_once(self):
+        writebehind.enqueue(writebehind.FOLLOW, self.reader.pk, self.author.pk)
+        get_user_stats(self.author.pk)
+        # Подписку записали в обход очереди после того, как воркер
+        # прочитал существующие
+        Follow.objects.create(user=self.reader, author=self.author)
+        with mock.patch.object(
+            writebehind, 'existing_follows', return_value=set()
+        ):
+            writebehind.flush()
+        self.assertEqual(get_user_stats(self.author.pk).followers, 1)
+
+    def test_follow_is_optimistic_and_flushed_in_batch(self):
+        profile = reverse('profile', args=['writer'])
+        self.client.get(reverse('profile_follow', args=['writer']))
+        response = self.client.get(profile)
+        self.assertTrue(response.context['following'])
+        self.assertEqual(response.context['stats'].followers, 1)
+        self.assertFalse(Follow.objects.exists())
+        writebehind.flush()
+        self.assertTrue(Follow.objects.filter(
+            user=self.reader, author=self.author
+        ).exists())
+        self.assertEqual(get_user_stats(self.author.pk).followers, 1)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=self.post
+        ).exists())
+        self.client.get(reverse('profile_unfollow', args=['writer']))
+        self.client.get(reverse('profile_follow', args=['writer']))
+        self.client.get(reverse('profile_unfollow', args=['writer']))
+        self.assertFalse(self.client.get(profile).context['following'])
+        writebehind.flush()
+        self.assertFalse(Follow.objects.exists())
+        self.assertEqual(get_user_stats(self.author.pk).followers, 0)
+
+
+class UserStatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='writer')
+        Post.objects.create(text='Запись', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def get_stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_profile_reads_stats_row(self):
+        response = self.authorized_client.get(
+            reverse('profile', kwargs={'username': 'writer'})
+        )
+        stats = response.context['stats']
+        self.assertEqual(
+            (stats.followers, stats.following, stats.posts),
+            (0, 0, 1)
+        )
+
+    def test_writes_keep_stats_current(self):
+        get_user_stats(self.user.pk)
+        get_user_stats(self.author.pk)
+        self.authorized_client.get(
+            reverse('profile_follow', kwargs={'username': 'writer'})
+        )
+        self.authorized_client.post(
+            reverse('new_post'),
+            data={'text': 'Ещё запись'}
+        )
+        self.assertEqual(self.get_stats(self.author).followers, 1)
+        self.assertEqual(self.get_stats(self.user).following, 1)
+        self.assertEqual(self.get_stats(self.user).posts, 1)
+        self.authorized_client.get(
+            reverse('profile_unfollow', kwargs={'username': 'writer'})
+        )
+        self.author.posts.all().delete()
+        self.assertEqual(self.get_stats(self.author).followers, 0)
+        self.assertEqual(self.get_stats(self.user).following, 0)
+        self.assertEqual(self.get_stats(self.author).posts, 0)
+
+    def test_recount_command_repairs_drift(self):
+        get_user_stats(self.author.pk)
+        UserStats.objects.filter(user=self.author).update(posts=42)
+        call_command('recount_user_stats', stdout=StringIO())
+        self.assertEqual(self.get_stats(self.author).posts, 1)
+        self.assertEqual(self.get_stats(self.user).posts, 0)
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR),
+    UPLOAD_STAGING_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR),
+    THUMBNAIL_CACHE='default'
+)
+class ThumbnailPipelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='dert123')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(settings.UPLOAD_STAGING_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        # Обработка удаляет оригинал, поэтому файл у каждого теста свой
+        self.post = Post.objects.create(
+            text='Запись с картинкой',
+            author=self.user,
+            image=SimpleUploadedFile(
+                name='small.gif',
+                content=small_gif,
+                content_type='image/gif'
+            )
+        )
+
+    def test_feed_shows_placeholder_until_thumbnails_are_ready(self):
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Картинка обрабатывается')
+        self.assertNotContains(response, '<img class="card-img"')
+
+    def test_generated_thumbnails_replace_placeholder(self):
+        generate_thumbnails(self.post.pk)
+        self.post.refresh_from_db()
+        self.assertTrue(self.post.image_ready)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, '<img class="card-img"')
+        self.assertTrue(response.context['page'][0].card_thumbnail)
+        self.assertFalse(KVStore.objects.exists())
+
+    def test_card_lists_every_width_lazily(self):
+        generate_thumbnails(self.post.pk)
+        response = self.client.get(reverse('index'))
+        post = response.context['page'][0]
+        extension = ingest_format()[1]
+        widths = [
+            int(geometry.split('x')[0])
+            for geometry, _ in settings.POST_THUMBNAILS
+        ]
+        self.assertEqual(
+            [int(item.split()[1][:-1]) for item in
+             post.card_srcset.split(', ')],
+            sorted(widths)
+        )
+        self.assertTrue(post.card_thumbnail.url.endswith(f'.{extension}'))
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, f'width="{widths[0]}"')
+        self.assertContains(response, 'srcset=')
+
+    @override_settings(THUMBNAIL_WORKERS=1)
+    def test_worker_result_is_marked_in_parent_process(self):
+        url = reverse('profile', args=[self.user.username])
+        etag = self.client.get(url)['ETag']
+        future = Future()
+        with mock.patch.object(thumbnails, 'get_executor') as get_executor:
+            get_executor.return_value.submit.return_value = future
+            thumbnails.submit_thumbnails(self.post.pk)
+        # Воркер уже отметил запись в базе, но не в кэше родителя
+        self.assertEqual(self.client.get(url)['ETag'], etag)
+        with run_on_commit():
+            future.set_result((self.user.pk, None))
+        self.assertNotEqual(self.client.get(url)['ETag'], etag)
+
+    def test_image_changed_outside_views_is_rescheduled(self):
+        generate_thumbnails(self.post.pk)
+        post = Post.objects.get(pk=self.post.pk)
+        post.image = self.legacy_post().image.name
+        post.save()
+        self.assertFalse(Post.objects.get(pk=post.pk).image_ready)
+        post.text = 'Только текст'
+        Post.objects.filter(pk=post.pk).update(image_ready=True)
+        post.save()
+        self.assertTrue(Post.objects.get(pk=post.pk).image_ready)
+
+    def test_profile_card_sizes_follow_its_column(self):
+        generate_thumbnails(self.post.pk)
+        profile = self.client.get(reverse('profile', args=['dert123']))
+        self.assertContains(profile, '(min-width: 1200px) 803px')
+        index = self.client.get(reverse('index'))
+        self.assertContains(index, '(min-width: 1200px) 1110px')
+
+    def test_ready_post_without_thumbnails_is_not_cut_in_request(self):
+        Post.objects.filter(pk=self.post.pk).update(image_ready=True)
+        cut = 'sorl.thumbnail.base.ThumbnailBackend.get_thumbnail'
+        with mock.patch(cut) as get_thumbnail, \
+                mock.patch.object(thumbnails, 'submit_thumbnails'):
+            response = self.client.get(reverse('index'))
+        get_thumbnail.assert_not_called()
+        self.assertContains(response, 'Картинка обрабатывается')
+
+    def test_lost_thumbnail_keys_requeue_post_once(self):
+        Post.objects.filter(pk=self.post.pk).update(image_ready=True)
+        with mock.patch.object(thumbnails, 'submit_thumbnails') as submit:
+            for _ in range(2):
+                with run_on_commit():
+                    thumbnails.prefetch_thumbnails(
+                        [Post.objects.get(pk=self.post.pk)]
+                    )
+        submit.assert_called_once_with(self.post.pk)
+
+    def test_thumbnail_cache_never_culls(self):
+        location = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        store = PersistentFileCache(location, {
+            'TIMEOUT': None, 'OPTIONS': {'MAX_ENTRIES': 1}
+        })
+        for key in ('first', 'second', 'third'):
+            store.set(key, key)
+        self.assertEqual(len(store.get_many(['first', 'second', 'third'])), 3)
+
+    def test_warm_thumbnails_command_marks_posts_ready(self):
+        out = StringIO()
+        call_command('warm_thumbnails', workers=0, stdout=out)
+        self.assertIn('Готово записей: 1', out.getvalue())
+        self.assertTrue(Post.objects.get(pk=self.post.pk).image_ready)
+
+    def photo(self):
+        image = Image.new('RGB', (2400, 1200), 'red')
+        exif = image.getexif()
+        # Снимок повёрнут: при показе его нужно развернуть на 90°
+        exif[0x0112] = 6
+        exif[0x010F] = 'Камера'
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', exif=exif, quality=95)
+        return buffer.getvalue()
+
+    def legacy_post(self):
+        """Запись с оригиналом, загруженным до обработки при сохранении."""
+        name = default_storage.save('posts/photo.jpg', ContentFile(
+            self.photo()
+        ))
+        return Post.objects.create(text='Фото', author=self.user, image=name)
+
+    def assertIngested(self, post):
+        self.assertTrue(post.image.name.startswith(INGESTED_DIR))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, ingest_format()[0])
+            self.assertEqual(image.size, (800, 1600))
+            self.assertEqual(dict(image.getexif()), {})
+
+    def test_upload_is_published_only_after_processing(self):
+        post = Post.objects.create(
+            text='Фото',
+            author=self.user,
+            image=SimpleUploadedFile('upload.jpg', self.photo())
+        )
+        staged = post.image.name
+        self.assertTrue(staged.startswith(STAGED_DIR))
+        self.assertTrue(
+            post.image.path.startswith(settings.UPLOAD_STAGING_ROOT)
+        )
+        self.assertFalse(default_storage.exists('posts/upload.jpg'))
+        self.assertFalse(post.image_ready)
+        generate_thumbnails(post.pk)
+        post.refresh_from_db()
+        self.assertIngested(post)
+        self.assertTrue(post.image_ready)
+        self.assertFalse(default_storage.exists(staged))
+
+    def test_abandoned_uploads_are_swept(self):
+        orphan = default_storage.save(
+            f'{STAGED_DIR}orphan.jpg', ContentFile(self.photo())
+        )
+        self.assertEqual(sweep_staged(), 0)
+        with override_settings(STAGED_UPLOAD_TTL=-1):
+            self.assertEqual(sweep_staged(), 1)
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertTrue(default_storage.exists(self.post.image.name))
+
+    def test_legacy_original_is_ingested_only_on_request(self):
+        post = self.legacy_post()
+        original = post.image.name
+        generate_thumbnails(post.pk)
+        post.refresh_from_db()
+        self.assertEqual(post.image.name, original)
+        out = StringIO()
+        call_command(
+            'warm_thumbnails', workers=0, all=True, ingest=True, stdout=out
+        )
+        post.refresh_from_db()
+        self.assertIngested(post)
+        self.assertFalse(post.image.storage.exists(original))
+        self.assertTrue(post.image_ready)
+
+    def test_shared_original_is_kept(self):
+        post = self.legacy_post()
+        other = Post.objects.create(
+            text='Та же картинка', author=self.user, image=post.image.name
+        )
+        generate_thumbnails(post.pk, ingest=True)
+        other.refresh_from_db()
+        self.assertTrue(other.image.storage.exists(other.image.name))
+        generate_thumbnails(other.pk, ingest=True)
+        other.refresh_from_db()
+        self.assertTrue(other.image.name.startswith(INGESTED_DIR))
+
+    def test_api_hides_image_until_ready(self):
+        url = reverse('api:detail', args=['posts', self.post.pk])
+        self.assertIsNone(self.client.get(url).json()['image'])
+        generate_thumbnails(self.post.pk)
+        self.post.refresh_from_db()
+        self.assertEqual(
+            self.client.get(url).json()['image'], self.post.image.url
+        )
@@ -0,0 +1,195 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import F
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from .caching import count_lookups
+from .conditional import mark_post_changed
+from .images import ingest_format, ingest_image
+from .models import Post
+from .storage import is_staged
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def init_worker():
+    django.setup()
+    # Соединения родителя не годятся для дочернего процесса.
+    connections.close_all()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            initializer=init_worker
+        )
+    return _executor
+
+
+def card_thumbnails():
+    """Все ширины миниатюры карточки; формат — как у обработанных картинок."""
+    image_format = ingest_format()[0]
+    return [
+        (geometry, {**options, 'format': image_format})
+        for geometry, options in settings.POST_THUMBNAILS
+    ]
+
+
+def cut_card_thumbnails(image):
+    for geometry, options in card_thumbnails():
+        get_thumbnail(image, geometry, **options)
+
+
+def generate_thumbnails(post_id, ingest=False):
+    """Нарезает миниатюры картинки записи и отмечает её готовой.
+
+    Отложенная загрузка сперва уменьшается, очищается от EXIF и
+    публикуется; ingest=True так же заменяет и старый оригинал.
+
+    Возвращает (author_id, group_id) готовой записи, иначе None.
+    Версии страниц в кэше отмечает вызывающий: у дочернего процесса
+    кэш в памяти свой, и его правки родитель не увидит.
+    """
+    post = Post.objects.filter(pk=post_id).only(
+        'image', 'author_id', 'group_id'
+    ).first()
+    if post is None or not post.image:
+        return None
+    if ingest or is_staged(post.image.name):
+        ingest_image(post)
+    if is_staged(post.image.name):
+        # Загрузку успели заменить; её обработает следующая задача
+        return None
+    cut_card_thumbnails(post.image)
+    # Если картинку успели заменить, готовность отметит следующая задача.
+    ready = Post.objects.filter(pk=post_id, image=post.image.name).update(
+        image_ready=True,
+        card_version=F('card_version') + 1
+    )
+    if not ready:
+        return None
+    return post.author_id, post.group_id
+
+
+def mark_ready(post_id, scopes):
+    if scopes is not None:
+        mark_post_changed(post_id, *scopes)
+
+
+def submit_thumbnails(post_id):
+    if not settings.THUMBNAIL_WORKERS:
+        mark_ready(post_id, generate_thumbnails(post_id))
+        return
+
+    def done(future):
+        # Колбэк выполняется в родительском процессе
+        error = future.exception()
+        if error is not None:
+            logger.error('Не удалось нарезать миниатюры: %r', error)
+        else:
+            mark_ready(post_id, future.result())
+
+    get_executor().submit(generate_thumbnails, post_id).add_done_callback(
+        done
+    )
+
+
+def schedule_thumbnails(post):
+    """Ставит нарезку в очередь, как только запись окажется в базе."""
+    Post.objects.filter(pk=post.pk).update(
+        image_ready=False,
+        card_version=F('card_version') + 1
+    )
+    post.image_ready = False
+    if post.image:
+        transaction.on_commit(lambda: submit_thumbnails(post.pk))
+
+
+def requeue_thumbnails(post_ids):
+    """Снова ставит в нарезку готовые записи, чьи ключи миниатюр пропали.
+
+    Повтор для записи — не чаще раза за THUMBNAIL_REQUEUE_TTL: её
+    страницу могут открыть много раз, пока задача в очереди.
+    """
+    for post_id in post_ids:
+        if cache.add(
+            f'thumbnails_requeued:{post_id}',
+            True,
+            settings.THUMBNAIL_REQUEUE_TTL
+        ):
+            transaction.on_commit(partial(submit_thumbnails, post_id))
+
+
+def thumbnail_file(image, geometry, options):
+    """Миниатюра под тем именем, которое ей даст sorl, без чтения картинки."""
+    backend = default.backend
+    source = ImageFile(image)
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry, options)
+    return ImageFile(name, default.storage)
+
+
+def prefetch_thumbnails(posts):
+    """Достаёт все ширины миниатюр карточек для страницы ленты разом.
+
+    card_thumbnail — основная ширина для src, card_srcset — все
+    найденные ширины для srcset. Готовые записи без основной
+    миниатюры снова ставятся в нарезку.
+    """
+    thumbnails = card_thumbnails()
+    wanted = {
+        post.pk: [
+            thumbnail_file(post.image, geometry, options)
+            for geometry, options in thumbnails
+        ]
+        for post in posts
+        if post.image_ready
+    }
+    files = [thumbnail for files in wanted.values() for thumbnail in files]
+    kvstore = default.kvstore
+    if not files:
+        found = {}
+    elif hasattr(kvstore, 'get_many'):
+        found = kvstore.get_many(files)
+    else:
+        found = {thumbnail.key: kvstore.get(thumbnail) for thumbnail in files}
+    found = {key: value for key, value in found.items() if value}
+    count_lookups('thumbnail', hits=len(found), misses=len(files) - len(found))
+    requeue_thumbnails([
+        post_id for post_id, files in wanted.items()
+        if files[0].key not in found
+    ])
+    for post in posts:
+        variants = [
+            found[thumbnail.key]
+            for thumbnail in wanted.get(post.pk, [])
+            if thumbnail.key in found
+        ]
+        main = wanted.get(post.pk)
+        post.card_thumbnail = found.get(main[0].key) if main else None
+        post.card_srcset = ', '.join(
+            f'{variant.url} {variant.width}w'
+            for variant in sorted(variants, key=lambda item: item.width)
+        )
+    return posts
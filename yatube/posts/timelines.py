@@ -0,0 +1,200 @@
+from django.contrib.auth import get_user_model
+from django.core.paginator import Paginator
+from django.db.models import Count, Max, Q, Sum
+from django.utils.functional import cached_property
+
+from yatube.settings import TIMELINE_BACKFILL, TIMELINE_FANOUT_LIMIT
+
+from .models import Follow, Post, TimelineEntry
+from .paginators import CursorPaginator, decode_cursor
+from .stats import get_user_stats, recount_user_stats
+
+User = get_user_model()
+
+
+def is_heavy_author(author_id):
+    return get_user_stats(author_id).followers > TIMELINE_FANOUT_LIMIT
+
+
+def fan_out_post(post):
+    """Раскладывает новую запись по лентам подписчиков автора."""
+    if is_heavy_author(post.author_id):
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in follower_ids
+        ],
+        ignore_conflicts=True
+    )
+
+
+def backfill_timeline(user_id, author_id):
+    """Копирует в ленту TIMELINE_BACKFILL последних записей автора.
+
+    Если история длиннее, в подписке запоминается, с какой даты
+    лента неполна.
+    """
+    if is_heavy_author(author_id):
+        return
+    posts = list(
+        Post.objects.filter(author_id=author_id)
+        .order_by('-pub_date')
+        .values_list('pk', 'pub_date')[:TIMELINE_BACKFILL + 1]
+    )
+    history_from = None
+    if len(posts) > TIMELINE_BACKFILL:
+        posts = posts[:TIMELINE_BACKFILL]
+        history_from = posts[-1][1]
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+            for pk, pub_date in posts
+        ],
+        ignore_conflicts=True
+    )
+    Follow.objects.filter(user_id=user_id, author_id=author_id).update(
+        history_from=history_from
+    )
+
+
+def catch_up_author(author_id):
+    """Раскладывает записи автора, который опустился до лимита подписчиков.
+
+    Пока автор был популярным, его записи не раскладывались, а читались
+    запросом; теперь ленты подписчиков должны получить их сами.
+    """
+    if get_user_stats(author_id).followers != TIMELINE_FANOUT_LIMIT:
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True)
+    for user_id in follower_ids.iterator():
+        backfill_timeline(user_id, author_id)
+
+
+def prune_timeline(user_id, author_id):
+    TimelineEntry.objects.filter(
+        user_id=user_id,
+        post__author_id=author_id
+    ).delete()
+
+
+def heavy_author_ids(user):
+    return list(
+        Follow.objects.filter(
+            user=user,
+            author__stats__followers__gt=TIMELINE_FANOUT_LIMIT
+        ).values_list('author_id', flat=True)
+    )
+
+
+def followed_posts(user):
+    """Лента подписок прямым запросом: медленнее готовой, зато полная."""
+    return Post.objects.for_feed().filter(author__following__user=user)
+
+
+def timeline_posts(user):
+    """Лента подписок: чтение готовой ленты плюс посты популярных авторов."""
+    posts = Post.objects.for_feed()
+    heavy_ids = heavy_author_ids(user)
+    if heavy_ids:
+        entries = TimelineEntry.objects.filter(user=user).values('post_id')
+        return posts.filter(Q(pk__in=entries) | Q(author_id__in=heavy_ids))
+    return posts.filter(timeline_entries__user=user).order_by(
+        '-timeline_entries__pub_date'
+    )
+
+
+def follow_summary(user):
+    """Число записей в ленте подписок по счётчикам авторов и дата,
+    до которой готовая лента неполна (None — полна), одним запросом."""
+    summary = Follow.objects.filter(user=user).aggregate(
+        posts=Sum('author__stats__posts'),
+        missing=Count('pk', filter=Q(author__stats__isnull=True)),
+        cutoff=Max('history_from')
+    )
+    if summary['missing']:
+        # Строки счётчиков создаются лениво
+        recount_user_stats(
+            User.objects.filter(following__user=user, stats__isnull=True),
+            replace=False
+        )
+        return follow_summary(user)
+    return summary['posts'] or 0, summary['cutoff']
+
+
+def timeline_cutoff(user):
+    return Follow.objects.filter(user=user).aggregate(
+        cutoff=Max('history_from')
+    )['cutoff']
+
+
+def timeline_covers(posts, cutoff, complete):
+    """Готовой ленты хватает, если страница полна и целиком новее cutoff:
+    всё, что в ленту не разложено, не новее этой даты."""
+    if cutoff is None:
+        return True
+    return complete and (not posts or posts[-1].pub_date > cutoff)
+
+
+class TimelinePaginator(Paginator):
+    """Страницы ленты подписок из готовой ленты.
+
+    Общее число записей берётся из счётчиков авторов. Первые
+    TIMELINE_BACKFILL записей у каждого автора разложены всегда, поэтому
+    запросом по подпискам читаются только более глубокие страницы
+    и только если готовая лента неполна.
+    """
+
+    def __init__(self, user, per_page, **kwargs):
+        super().__init__(followed_posts(user), per_page, **kwargs)
+        self.user = user
+
+    @cached_property
+    def summary(self):
+        return follow_summary(self.user)
+
+    @cached_property
+    def count(self):
+        return self.summary[0]
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = min(bottom + self.per_page, self.count)
+        if self.summary[1] is None or top <= TIMELINE_BACKFILL:
+            posts = timeline_posts(self.user)[bottom:top]
+        else:
+            posts = self.object_list[bottom:top]
+        return self._get_page(posts, number, self)
+
+
+def timeline_cursor_page(user, per_page, after=None, before=None):
+    """Страница по курсору из готовой ленты, если её там хватает."""
+    cutoff = timeline_cutoff(user)
+    full = CursorPaginator(followed_posts(user), per_page)
+    if after and cutoff is not None:
+        cursor = decode_cursor(after)
+        if cursor is not None and cursor[0] <= cutoff:
+            # Вся страница старше cutoff — готовую ленту не читаем
+            return full.cursor_page(after=after)
+    page = CursorPaginator(timeline_posts(user), per_page).cursor_page(
+        after=after, before=before
+    )
+    if before:
+        cursor = decode_cursor(before)
+        # Более новые записи, чем курсор, разложены, если он новее cutoff
+        covered = cutoff is None or (
+            cursor is not None and cursor[0] > cutoff
+        )
+    else:
+        covered = timeline_covers(
+            page.object_list, cutoff, page.has_next()
+        )
+    if covered:
+        return page
+    return full.cursor_page(after=after, before=before)
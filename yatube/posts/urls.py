@@ -1,5 +1,8 @@
-from django.urls import path
+from django.urls import path, register_converter
 from . import views
+from .feeds import FeedFormatConverter
+
+register_converter(FeedFormatConverter, 'feed')
 
 urlpatterns = [
     path("", views.index, name='index'),
@@ -16,12 +19,33 @@ urlpatterns = [
         name="profile_unfollow"
     ),
     path("follow/", views.follow_index, name="follow_index"),
+    path('search/', views.search, name='search'),
+    path(
+        'feeds/index.<feed:feed_format>',
+        views.index_feed,
+        name='index_feed'
+    ),
+    path(
+        'feeds/group/<slug:slug>.<feed:feed_format>',
+        views.group_feed,
+        name='group_feed'
+    ),
+    path(
+        'feeds/author/<str:username>.<feed:feed_format>',
+        views.profile_feed,
+        name='profile_feed'
+    ),
     path(
         "<username>/<int:post_id>/comment",
         views.add_comment,
         name="add_comment"),
     path('<str:username>/', views.profile, name='profile'),
     path('<str:username>/<int:post_id>/', views.post_view, name='post_view'),
+    path(
+        '<str:username>/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     path(
         '<str:username>/<int:post_id>/edit/',
         views.post_edit,
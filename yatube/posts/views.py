@@ -1,37 +1,141 @@
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
-from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
 from django.core.paginator import Paginator
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
-from django.core.cache import cache
+from django.db import transaction
 from http import HTTPStatus
 
-from yatube.settings import POSTS_PAGINATOR_COUNT
+from core import routers
+
+from yatube.settings import (
+    COMMENTS_PAGE_SIZE, POSTS_CURSOR_PAGINATION, POSTS_PAGINATOR_COUNT
+)
 
 from .models import Post, Group, Follow
 from . import forms
+from .caching import get_index_page, invalidate_index
+from .conditional import conditional_page, follower_scope, post_scope
+from .feeds import feed_response
+from .counters import ALL_POSTS, CountedPaginator, author_scope, group_scope
+from .paginators import CursorPaginator
+from .search import get_search_backend
+from .stats import get_user_stats
+from .thumbnails import prefetch_thumbnails
+from .timelines import TimelinePaginator, timeline_cursor_page
+from .writebehind import (
+    enqueue_comment, enqueue_follow, pending_comments, pending_following
+)
 
 User = get_user_model()
 
 
-def index(request):
-    posts = cache.get('index_page')
-    if posts is None:
-        posts = Post.objects.all()
-        cache.set('index_page', posts, timeout=20)
-    paginator = Paginator(posts, POSTS_PAGINATOR_COUNT)
+def is_cursor_request(request):
+    return (
+        POSTS_CURSOR_PAGINATION
+        or 'after' in request.GET
+        or 'before' in request.GET
+    )
+
+
+def get_paginator(posts, count_scope=None):
+    if count_scope is None:
+        return Paginator(posts, POSTS_PAGINATOR_COUNT)
+    return CountedPaginator(posts, POSTS_PAGINATOR_COUNT, count_scope)
+
+
+def get_page(request, posts, count_scope=None):
+    if is_cursor_request(request):
+        paginator = CursorPaginator(posts, POSTS_PAGINATOR_COUNT)
+        return paginator.cursor_page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before')
+        )
+    paginator = get_paginator(posts, count_scope)
     page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    return paginator.get_page(page_number)
+
+
+def get_comments_page(post, after=None):
+    """Порция комментариев от новых к старым, начиная после курсора."""
+    paginator = CursorPaginator(
+        post.comments.select_related('author'),
+        COMMENTS_PAGE_SIZE,
+        date_field='created'
+    )
+    return paginator.cursor_page(after=after)
+
+
+def get_following(user, author, stats):
+    """Подписан ли зритель на автора, с учётом отложенной подписки."""
+    following = author.following.filter(user=user.id).exists()
+    pending = pending_following(user, author)
+    if pending is not None and pending != following:
+        # Счётчик показываем таким, каким он станет после записи
+        stats.followers += 1 if pending else -1
+        following = pending
+    return following
+
+
+def index_scopes(request, **kwargs):
+    return [ALL_POSTS]
+
+
+def group_scopes(request, slug, **kwargs):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True
+    ).first()
+    if group_id is not None:
+        return [group_scope(group_id)]
+
+
+def author_id(username):
+    return User.objects.filter(username=username).values_list(
+        'pk', flat=True
+    ).first()
+
+
+def profile_scopes(request, username, **kwargs):
+    pk = author_id(username)
+    if pk is not None:
+        return [author_scope(pk)]
+
+
+def post_scopes(request, username, post_id):
+    pk = author_id(username)
+    if pk is not None:
+        return [post_scope(post_id), author_scope(pk)]
+
+
+def follow_scopes(request):
+    return [ALL_POSTS, follower_scope(request.user.pk)]
+
+
+@conditional_page(index_scopes)
+def index(request):
+    posts = Post.objects.for_feed()
+    if is_cursor_request(request):
+        page = get_page(request, posts)
+    else:
+        page = get_index_page(
+            get_paginator(posts, ALL_POSTS),
+            request.GET.get('page')
+        )
+    prefetch_thumbnails(page.object_list)
     form = forms.CommentForm()
     context = {'page': page, 'form': form}
     return render(request, 'index.html', context)
 
 
+@conditional_page(group_scopes)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, POSTS_PAGINATOR_COUNT)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    posts = group.posts.for_feed()
+    page = get_page(request, posts, group_scope(group.pk))
+    prefetch_thumbnails(page.object_list)
     form = forms.CommentForm()
     context = {
         'page': page,
@@ -42,54 +146,131 @@ def group_posts(request, slug):
     return render(request, 'group.html', context)
 
 
+@conditional_page(index_scopes)
+def index_feed(request, feed_format):
+    return feed_response(
+        request,
+        feed_format,
+        'Последние обновления на сайте',
+        reverse('index'),
+        Post.objects.all()
+    )
+
+
+@conditional_page(group_scopes)
+def group_feed(request, slug, feed_format):
+    group = get_object_or_404(Group, slug=slug)
+    return feed_response(
+        request,
+        feed_format,
+        f'Записи сообщества {group.title}',
+        reverse('group_posts', kwargs={'slug': slug}),
+        group.posts.all()
+    )
+
+
+@conditional_page(profile_scopes)
+def profile_feed(request, username, feed_format):
+    author = get_object_or_404(User, username=username)
+    return feed_response(
+        request,
+        feed_format,
+        f'Записи {author.get_full_name() or author.username}',
+        reverse('profile', kwargs={'username': username}),
+        author.posts.all()
+    )
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    results = get_search_backend().search(query)
+    page = get_paginator(results).get_page(request.GET.get('page'))
+    prefetch_thumbnails(page.object_list)
+    context = {
+        'page': page,
+        'query': query,
+        'form': forms.CommentForm()
+    }
+    return render(request, 'search.html', context)
+
+
 @login_required
+@transaction.atomic
 def new_post(request):
-    form = forms.PostForm(request.POST or None)
+    form = forms.PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        invalidate_index()
         return redirect('index')
     form = forms.PostForm()
     context = {'form': form}
     return render(request, 'new_post.html', context)
 
 
+@conditional_page(profile_scopes)
 def profile(request, username):
     author = get_object_or_404(User, username=username)
-    posts = Post.objects.filter(author=author)
-    paginator = Paginator(posts, POSTS_PAGINATOR_COUNT)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    followers = Follow.objects.filter(author=author).count
-    following_authors = Follow.objects.filter(user=author).count
-    following = author.following.filter(user=request.user.id).exists()
+    posts = author.posts.for_feed()
+    page = get_page(request, posts, author_scope(author.pk))
+    prefetch_thumbnails(page.object_list)
+    stats = get_user_stats(author.pk)
     context = {
         'author': author,
+        'stats': stats,
         'page': page,
-        'following': following,
-        'followers': followers,
-        'following_authors': following_authors
+        'following': get_following(request.user, author, stats)
     }
     return render(request, 'profile.html', context)
 
 
+@conditional_page(post_scopes)
 def post_view(request, username, post_id):
     author = get_object_or_404(User, username=username)
-    post = get_object_or_404(Post, id=post_id, author=author)
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.for_feed(),
+        id=post_id,
+        author=author
+    )
+    prefetch_thumbnails([post])
+    after = request.GET.get('comments_after')
+    comments = get_comments_page(post, after)
     form = forms.CommentForm()
-    following = author.following.filter(user=request.user.id).exists()
+    stats = get_user_stats(author.pk)
     context = {
         'author': author,
+        'stats': stats,
         'post': post,
         'comments': comments,
+        # Свои ещё не записанные комментарии — над первой порцией
+        'pending_comments': (
+            [] if after else pending_comments(request.user, post)
+        ),
         'form': form,
-        'following': following
+        'following': get_following(request.user, author, stats)
     }
     return render(request, 'post.html', context)
 
 
+@conditional_page(post_scopes)
+def post_comments(request, username, post_id):
+    """Следующая порция комментариев для кнопки «Показать ещё»."""
+    post = get_object_or_404(
+        Post.objects.only('pk'),
+        id=post_id,
+        author__username=username
+    )
+    comments = get_comments_page(post, request.GET.get('after'))
+    html = render_to_string(
+        'includes/comment_list.html', {'comments': comments}, request
+    )
+    return JsonResponse({
+        'html': html,
+        'next': comments.next_cursor() if comments.has_next() else None,
+    })
+
+
 @login_required
 def post_edit(request, username, post_id):
     post = get_object_or_404(Post, author__username=username, id=post_id)
@@ -105,7 +286,8 @@ def post_edit(request, username, post_id):
         instance=post
     )
     if form.is_valid():
-        form.save()
+        post = form.save()
+        invalidate_index()
         return redirect(
             'post_view',
             username=request.user.username,
@@ -142,10 +324,14 @@ def add_comment(request, username, post_id):
     post = get_object_or_404(Post, author__username=username, id=post_id)
     form = forms.CommentForm(request.POST or None)
     if form.is_valid():
-        comment = form.save(commit=False)
-        comment.author = request.user
-        comment.post = post
-        comment.save()
+        if settings.WRITE_BEHIND:
+            enqueue_comment(request.user, post, form.cleaned_data['text'])
+        else:
+            comment = form.save(commit=False)
+            comment.author = request.user
+            comment.post = post
+            comment.save()
+            invalidate_index()
         return redirect(
             'post_view',
             username=username,
@@ -156,31 +342,51 @@ def add_comment(request, username, post_id):
 
 
 @login_required
+@conditional_page(follow_scopes)
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(posts, POSTS_PAGINATOR_COUNT)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    if is_cursor_request(request):
+        page = timeline_cursor_page(
+            request.user,
+            POSTS_PAGINATOR_COUNT,
+            after=request.GET.get('after'),
+            before=request.GET.get('before')
+        )
+    else:
+        paginator = TimelinePaginator(request.user, POSTS_PAGINATOR_COUNT)
+        page = paginator.get_page(request.GET.get('page'))
+    prefetch_thumbnails(page.object_list)
     context = {
         'page': page,
-        'paginator': paginator,
+        'paginator': page.paginator,
     }
     return render(request, 'follow.html', context)
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
+    routers.mark_user_write()
     author = get_object_or_404(User, username=username)
-    if author != request.user:
+    if author == request.user:
+        return redirect('profile', username=username)
+    if settings.WRITE_BEHIND:
+        enqueue_follow(request.user, author)
+    else:
         Follow.objects.get_or_create(user=request.user, author=author)
     return redirect('profile', username=username)
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
+    routers.mark_user_write()
     author = get_object_or_404(User, username=username)
-    follower = Follow.objects.filter(user=request.user, author=author)
-    if follower.exists():
-        if author != request.user:
+    if author == request.user:
+        return redirect('profile', username=username)
+    if settings.WRITE_BEHIND:
+        enqueue_follow(request.user, author, follow=False)
+    else:
+        follower = Follow.objects.filter(user=request.user, author=author)
+        if follower.exists():
             follower.delete()
     return redirect('profile', username=username)
@@ -0,0 +1,248 @@
+import sqlite3
+import time
+import uuid
+from collections import defaultdict, namedtuple
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Value, When
+from django.utils.timezone import utc
+
+from .caching import invalidate_index
+from .conditional import follower_scope, mark_changed, post_scope
+from .counters import author_scope
+from .models import Comment, Follow, Post
+from .search import get_search_backend
+from .signals import comment_changed, follow_created
+
+User = get_user_model()
+
+COMMENT = 'comment'
+FOLLOW = 'follow'
+UNFOLLOW = 'unfollow'
+
+Job = namedtuple('Job', 'id kind user_id target_id text created uid')
+
+_ready = set()
+
+
+def connect():
+    """Соединение с файлом очереди; схема создаётся при первом обращении."""
+    path = settings.WRITE_BEHIND_QUEUE
+    connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+    if path not in _ready:
+        connection.execute('PRAGMA journal_mode = wal')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS queue ('
+            'id INTEGER PRIMARY KEY, kind TEXT NOT NULL, '
+            'user_id INTEGER NOT NULL, target_id INTEGER NOT NULL, '
+            'text TEXT, created REAL NOT NULL, uid TEXT)'
+        )
+        columns = [
+            row[1] for row in connection.execute('PRAGMA table_info(queue)')
+        ]
+        if 'uid' not in columns:
+            # Очередь из прошлой версии: ключи задачам выдаём на месте
+            connection.execute('ALTER TABLE queue ADD COLUMN uid TEXT')
+            connection.execute(
+                'UPDATE queue SET uid = lower(hex(randomblob(16)))'
+            )
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS queue_user_target '
+            'ON queue (user_id, target_id)'
+        )
+        _ready.add(path)
+    return connection
+
+
+def enqueue(kind, user_id, target_id, text=None):
+    connection = connect()
+    try:
+        connection.execute(
+            'INSERT INTO queue '
+            '(kind, user_id, target_id, text, created, uid) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [kind, user_id, target_id, text, time.time(), uuid.uuid4().hex]
+        )
+    finally:
+        connection.close()
+
+
+def enqueue_comment(user, post, text):
+    enqueue(COMMENT, user.pk, post.pk, text)
+    # Новый ETag, чтобы автор не получил 304 без своего комментария
+    mark_changed(post_scope(post.pk))
+
+
+def enqueue_follow(user, author, follow=True):
+    enqueue(FOLLOW if follow else UNFOLLOW, user.pk, author.pk)
+    mark_changed(author_scope(author.pk), follower_scope(user.pk))
+
+
+def queued_at(created):
+    return datetime.fromtimestamp(created, tz=utc)
+
+
+def pending_rows(user_id, target_id, kinds):
+    connection = connect()
+    try:
+        return connection.execute(
+            'SELECT kind, text, created FROM queue '
+            'WHERE user_id = ? AND target_id = ? '
+            f'AND kind IN ({", ".join("?" * len(kinds))}) ORDER BY id',
+            [user_id, target_id, *kinds]
+        ).fetchall()
+    finally:
+        connection.close()
+
+
+def pending_comments(user, post):
+    """Ещё не записанные комментарии пользователя, новые сверху."""
+    if not settings.WRITE_BEHIND or not user.is_authenticated:
+        return []
+    rows = pending_rows(user.pk, post.pk, [COMMENT])
+    return [
+        Comment(
+            post=post,
+            author=user,
+            text=text,
+            created=queued_at(created)
+        )
+        for kind, text, created in reversed(rows)
+    ]
+
+
+def pending_following(user, author):
+    """True или False по последней отложенной подписке, None — если её нет."""
+    if not settings.WRITE_BEHIND or not user.is_authenticated:
+        return None
+    rows = pending_rows(user.pk, author.pk, [FOLLOW, UNFOLLOW])
+    if not rows:
+        return None
+    return rows[-1][0] == FOLLOW
+
+
+def existing_ids(model, pks):
+    return set(model.objects.filter(pk__in=pks).values_list('pk', flat=True))
+
+
+def apply_comments(jobs):
+    """Пишет комментарии одним bulk_create, пропуская уже записанные.
+
+    Очередь доставляет задачи не меньше одного раза: если воркер упал
+    после записи, но до удаления пачки, повтор узнаётся по ключу задачи
+    в queue_uid. Одинаковые комментарии подряд — разные задачи.
+    """
+    posts = existing_ids(Post, {job.target_id for job in jobs})
+    users = existing_ids(User, {job.user_id for job in jobs})
+    jobs = [
+        job for job in jobs if job.target_id in posts and job.user_id in users
+    ]
+    if not jobs:
+        return []
+    written = set(Comment.objects.filter(
+        queue_uid__in=[job.uid for job in jobs]
+    ).values_list('queue_uid', flat=True))
+    jobs = [job for job in jobs if job.uid not in written]
+    if not jobs:
+        return []
+    Comment.objects.bulk_create([
+        Comment(
+            author_id=job.user_id,
+            post_id=job.target_id,
+            text=job.text,
+            queue_uid=job.uid
+        )
+        for job in jobs
+    ])
+    inserted = Comment.objects.filter(queue_uid__in=[job.uid for job in jobs])
+    # auto_now_add ставит время записи; комментарий датируем отправкой
+    inserted.update(created=Case(
+        *[When(queue_uid=job.uid, then=Value(queued_at(job.created)))
+          for job in jobs],
+        output_field=models.DateTimeField()
+    ))
+    # bulk_create не шлёт post_save: индекс и карточки обновляем сами
+    comments = list(inserted)
+    for comment in comments:
+        get_search_backend().index_comment(comment)
+    for comment in {comment.post_id: comment for comment in comments}.values():
+        comment_changed(comment)
+    return comments
+
+
+def existing_follows(users, authors):
+    return set(Follow.objects.filter(
+        user_id__in=users, author_id__in=authors
+    ).values_list('user_id', 'author_id'))
+
+
+def apply_follows(jobs):
+    """Сводит подписки пачки к итоговому состоянию каждой пары."""
+    wanted = {}
+    for job in jobs:
+        wanted[(job.user_id, job.target_id)] = job.kind == FOLLOW
+    users = existing_ids(User, {user_id for user_id, _ in wanted})
+    authors = existing_ids(User, {author_id for _, author_id in wanted})
+    existing = existing_follows(users, authors)
+    created = [
+        (user_id, author_id)
+        for (user_id, author_id), follow in wanted.items()
+        if follow and (user_id, author_id) not in existing
+        and user_id in users and author_id in authors
+    ]
+    try:
+        with transaction.atomic():
+            Follow.objects.bulk_create([
+                Follow(user_id=user_id, author_id=author_id)
+                for user_id, author_id in created
+            ])
+    except IntegrityError:
+        # Часть подписок записали в обход очереди: пишем по одной,
+        # и post_save вызовет follow_created только для новых строк
+        for user_id, author_id in created:
+            Follow.objects.get_or_create(user_id=user_id, author_id=author_id)
+    else:
+        for user_id, author_id in created:
+            follow_created(user_id, author_id)
+    removed = defaultdict(list)
+    for (user_id, author_id), follow in wanted.items():
+        if not follow and (user_id, author_id) in existing:
+            removed[user_id].append(author_id)
+    # Удаление через QuerySet само шлёт post_delete для каждой подписки
+    for user_id, author_ids in removed.items():
+        Follow.objects.filter(
+            user_id=user_id, author_id__in=author_ids
+        ).delete()
+
+
+def flush(batch_size=None):
+    """Переносит пачку из очереди в базу и возвращает её размер.
+
+    Задачи удаляются из очереди только после коммита в базу.
+    Рассчитано на один воркер flush_writes.
+    """
+    connection = connect()
+    try:
+        jobs = [
+            Job(*row) for row in connection.execute(
+                f'SELECT {", ".join(Job._fields)} FROM queue '
+                'ORDER BY id LIMIT ?',
+                [batch_size or settings.WRITE_BEHIND_BATCH]
+            )
+        ]
+        if not jobs:
+            return 0
+        with transaction.atomic():
+            comments = apply_comments(
+                [job for job in jobs if job.kind == COMMENT]
+            )
+            apply_follows([job for job in jobs if job.kind != COMMENT])
+        if comments:
+            invalidate_index()
+        connection.execute('DELETE FROM queue WHERE id <= ?', [jobs[-1].id])
+    finally:
+        connection.close()
+    return len(jobs)
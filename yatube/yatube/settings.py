@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'about',
     'users',
     'posts',
+    'api',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -50,6 +51,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы учесть запросы всех остальных слоёв
+    'core.middleware.QueryProfilerMiddleware',
+    # Снаружи сессий, чтобы заметить и запись сессии
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -88,8 +93,65 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Соединение живёт между запросами воркера, а не открывается
+        # заново на каждый
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        # Сколько секунд ждать, пока другой процесс допишет свою транзакцию
+        'OPTIONS': {'timeout': 5},
     }
 }
+# Выполняются при каждом подключении к SQLite (core.database).
+# WAL не блокирует читателей во время записи, а с synchronous=NORMAL
+# fsync идёт только при контрольных точках; cache_size в КиБ со знаком
+# минус, mmap_size в байтах.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -20000,
+    'mmap_size': 256 * 1024 * 1024,
+}
+# Копить ли гистограмму задержек чтения и записи (см. manage.py db_stats)
+DB_METRICS = True
+
+# Реплика для чтения лент. Локально это второй файл SQLite, который
+# manage.py sync_replica копирует с основной базы. Время копии команда
+# оставляет в кэше, так что нужен общий кэш (файлы, memcached):
+# без отметки страницы читаются из основной базы.
+if os.environ.get('DATABASE_REPLICA'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['DATABASE_REPLICA'],
+        'TEST': {'MIRROR': 'default'},
+    }
+REPLICA_DATABASE = 'replica' if 'replica' in DATABASES else None
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+# Страницы только для чтения, которым не страшно отставание реплики
+READ_REPLICA_VIEWS = (
+    'index',
+    'group_posts',
+    'profile',
+    'post_view',
+    'post_comments',
+    'follow_index',
+    'search',
+    'index_feed',
+    'group_feed',
+    'profile_feed',
+    'api:list',
+    'api:detail',
+    'api:batch',
+)
+# Сколько секунд после своей записи клиент читает из основной базы
+REPLICA_STICKY_SECONDS = 5
+REPLICA_STICKY_COOKIE = 'read_primary'
+
+# Отложенная запись: комментарии и подписки копятся в отдельном файле
+# SQLite и пачками переносятся в базу воркером manage.py flush_writes
+WRITE_BEHIND = os.environ.get('WRITE_BEHIND') == '1'
+WRITE_BEHIND_QUEUE = os.environ.get(
+    'WRITE_BEHIND_QUEUE', os.path.join(BASE_DIR, 'write_queue.sqlite3')
+)
+WRITE_BEHIND_BATCH = 500
 
 
 # Password validation
@@ -136,6 +198,13 @@ STATICFILES_DIRS = ((os.path.join(BASE_DIR, 'static')),)
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Загрузки до обработки (posts.storage.STAGED_DIR) хранилище кладёт
+# в UPLOAD_STAGING_ROOT: вне MEDIA_ROOT они по ссылке не отдаются
+DEFAULT_FILE_STORAGE = 'posts.storage.MediaStorage'
+UPLOAD_STAGING_ROOT = os.path.join(BASE_DIR, 'uploads')
+# Загрузки, не доставшиеся ни одной записи (транзакция откатилась),
+# старше STAGED_UPLOAD_TTL секунд удаляет warm_thumbnails
+STAGED_UPLOAD_TTL = 24 * 60 * 60
 
 LOGIN_URL = "/auth/login/"
 LOGIN_REDIRECT_URL = "index"
@@ -147,10 +216,119 @@ EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
 
+# Миниатюры картинок записей: геометрия и параметры sorl.thumbnail.
+# Нарезаются заранее в пуле процессов, лента только читает готовые.
+# Все ширины попадают в srcset карточки, первая служит и для src.
+POST_THUMBNAILS = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+    ('480x170', {'crop': 'center', 'upscale': True}),
+    ('1440x508', {'crop': 'center', 'upscale': True}),
+)
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+# Готовая запись без ключей миниатюр снова ставится в нарезку не чаще
+# раза за столько секунд
+THUMBNAIL_REQUEUE_TTL = 10 * 60
+# Перед нарезкой оригинал уменьшается до IMAGE_MAX_SIZE и пережимается
+# в WebP (в JPEG, если Pillow собран без WebP) без EXIF
+IMAGE_MAX_SIZE = (1600, 1600)
+IMAGE_QUALITY = 80
+
+# Бэкенд общего кэша задаётся окружением. locmem живёт внутри одного
+# процесса, поэтому при нескольких воркерах нужен file или memcached.
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'memcached': 'django.core.cache.backends.memcached.MemcachedCache',
+}
+CACHE_LOCATIONS = {
+    'locmem': '',
+    'file': os.path.join(BASE_DIR, 'cache', 'default'),
+    'memcached': '127.0.0.1:11211',
+}
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.environ.get(
+            'CACHE_LOCATION', CACHE_LOCATIONS[CACHE_BACKEND]
+        ),
+        'KEY_PREFIX': 'yatube',
+    },
+    # Ключи миниатюр не вытесняются: без них готовая запись
+    # показывала бы заглушку
+    'thumbnails': {
+        'BACKEND': 'posts.kvstore.PersistentFileCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'thumbnails'),
+        'TIMEOUT': None,
+    },
+}
+
+if CACHE_BACKEND != 'memcached':
+    # memcached сам вытесняет старое, а OPTIONS передаёт клиенту как есть
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 100000}
+
+# Ключи миниатюр sorl.thumbnail хранятся в кэше, а не в базе
+THUMBNAIL_KVSTORE = 'posts.kvstore.CacheKVStore'
+THUMBNAIL_CACHE = 'thumbnails'
+
+# Время жизни закэшированных страниц по представлениям, в секундах
+CACHE_TTLS = {
+    'index': int(os.environ.get('INDEX_CACHE_TTL', 20)),
+    'feed': int(os.environ.get('FEED_CACHE_TTL', 300)),
+}
+# Ленты Atom и JSON Feed: сколько последних записей отдавать
+# и до какого размера класть готовую ленту в кэш
+FEED_MAX_ITEMS = 200
+FEED_CACHE_MAX_BYTES = 512 * 1024
+
+# Входит в ETag страниц: новый выпуск со своими шаблонами
+# не должен отдавать 304 на страницы, собранные старыми
+ETAG_SALT = os.environ.get('RELEASE', '')
+
+# Поисковый движок по записям и комментариям: SQLiteFTSBackend
+# работает на индексе FTS5, LikeSearchBackend подходит любой базе
+SEARCH_BACKEND = 'posts.search.SQLiteFTSBackend'
+
+# Предельное число SQL-запросов на представление для авторизованного
+# пользователя; проверяется в тестах и журналируется в продакшене
+QUERY_BUDGETS = {
+    'index': 4,
+    'group_posts': 6,
+    'profile': 8,
+    # Страница по курсору на границе неполной готовой ленты
+    # дочитывается запросом по подпискам
+    'follow_index': 6,
+    'post_view': 8,
+    'search': 5,
+    'post_comments': 4,
+    # Страница API и её раскрытия: по запросу на каждый ресурс
+    'api:list': 3,
+    'api:detail': 3,
+    'api:batch': 4,
 }
+# Считать ли попадания и промахи кэша (см. manage.py cache_stats)
+CACHE_METRICS = True
+# Метрики кэша и задержек пишутся за примерно каждый N-й запрос
+# с весом N: меньше записей в общий кэш под нагрузкой
+METRICS_SAMPLE_EVERY = int(os.environ.get('METRICS_SAMPLE_EVERY', 1))
 
 POSTS_PAGINATOR_COUNT = 10
+# Сколько номеров страниц показывать по обе стороны от текущей
+POSTS_PAGINATOR_WINDOW = 2
+# Лента листается курсорами ?after=/?before= вместо номеров страниц
+POSTS_CURSOR_PAGINATION = False
+# Комментариев на странице записи и в каждой догружаемой порции
+COMMENTS_PAGE_SIZE = 20
+
+# Лента подписок: авторам с числом подписчиков больше лимита записи
+# не раскладываются, их посты подмешиваются при чтении
+TIMELINE_FANOUT_LIMIT = 1000
+# Сколько последних записей автора получает новый подписчик
+TIMELINE_BACKFILL = 200
+
+# JSON API: размер страницы по умолчанию и предел для ?limit=
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+# Сколько ключей принимает пакетный запрос /api/v1/<ресурс>/batch/
+API_BATCH_LIMIT = 100
@@ -26,6 +26,7 @@ urlpatterns = [
     #  если нужного шаблона для /auth не нашлось в файле users.urls —
     #  ищем совпадения в файле django.contrib.auth.urls
     path("auth/", include("django.contrib.auth.urls")),
+    path('api/v1/', include('api.urls', namespace='api')),
     path("", include("posts.urls")),
     path('about/', include('about.urls', namespace='about')),
 ]